@@ -0,0 +1,106 @@
+# ------------------------
+# 📚 Activity catalog (dictionary-encoded what_i_did)
+# ------------------------
+# Every distinct normalized activity (lower-cased, trimmed what_i_did) is
+# stored once in activity_catalog and time_log rows point at it through an
+# integer activity_id.  A trigger fills activity_id on every insert or edit,
+# so the write paths need no changes, and the dashboard groups by the integer
+# id instead of the text (see analytics.daily_activity_totals).
+#
+# Only that GROUP BY is dictionary-encoded.  time_log keeps the full
+# what_i_did next to activity_id (the app still reads, edits and searches it),
+# so the table grows by the id column rather than shrinking, and the dashboard
+# query still reads and normalizes the text of every row in range.  No activity
+# group is stored either: groups depend on the users and dates being viewed,
+# so the dashboard derives them from the totals the same way on both backends.
+#
+# This is a migration, not run by the app: the ALTER, the trigger and the
+# batched backfill of existing rows don't belong in a dashboard request.
+# Until it has run the dashboard groups by the text (idempotent, safe to re-run):
+#   DATABASE_URL=postgresql://... python activity_catalog.py
+import logging
+import os
+import sys
+import time
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Same normalization as analytics.normalize_activity()
+NORMALIZE_SQL = "lower(btrim(coalesce({column}, ''), E' \\t\\r\\n'))"
+
+CATALOG_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS activity_catalog (
+        id SERIAL PRIMARY KEY,
+        activity TEXT NOT NULL UNIQUE
+    )""",
+    "ALTER TABLE time_log ADD COLUMN IF NOT EXISTS activity_id INTEGER REFERENCES activity_catalog (id)",
+    f"""CREATE OR REPLACE FUNCTION time_log_set_activity_id() RETURNS trigger AS $$
+        DECLARE
+            normalized TEXT := {NORMALIZE_SQL.format(column="NEW.what_i_did")};
+        BEGIN
+            INSERT INTO activity_catalog (activity) VALUES (normalized) ON CONFLICT (activity) DO NOTHING;
+            SELECT id INTO NEW.activity_id FROM activity_catalog WHERE activity = normalized;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS time_log_activity_id_trg ON time_log",
+    """CREATE TRIGGER time_log_activity_id_trg BEFORE INSERT OR UPDATE OF what_i_did ON time_log
+       FOR EACH ROW EXECUTE PROCEDURE time_log_set_activity_id()""",
+]
+
+_CATALOG_FILL_SQL = f"""
+    INSERT INTO activity_catalog (activity)
+    SELECT DISTINCT {NORMALIZE_SQL.format(column="what_i_did")} FROM time_log WHERE activity_id IS NULL
+    ON CONFLICT (activity) DO NOTHING
+"""
+
+# One id range of existing rows; walking the primary key keeps each
+# transaction short without an index on activity_id
+_BACKFILL_SQL = f"""
+    UPDATE time_log t SET activity_id = c.id
+    FROM activity_catalog c
+    WHERE t.id > %s AND t.id <= %s AND t.activity_id IS NULL
+      AND c.activity = {NORMALIZE_SQL.format(column="t.what_i_did")}
+"""
+
+
+def ensure_catalog(conn):
+    # Creates the catalog and trigger and backfills existing rows; every step is idempotent
+    started = time.perf_counter()
+    with conn:
+        with conn.cursor() as cur:
+            for stmt in CATALOG_SCHEMA:
+                cur.execute(stmt)
+            cur.execute(_CATALOG_FILL_SQL)
+    # Rows inserted from here on get their id from the trigger
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT coalesce(max(id), 0) FROM time_log")
+            max_id = cur.fetchone()[0]
+    backfilled = 0
+    for last in range(0, max_id, BACKFILL_BATCH_SIZE):
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(_BACKFILL_SQL, (last, last + BACKFILL_BATCH_SIZE))
+                backfilled += cur.rowcount
+    logging.info(f"Activity catalog ready: backfilled {backfilled} rows in {time.perf_counter() - started:.1f}s")
+
+
+def catalog_ready(conn):
+    # True once the migration has added time_log.activity_id
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'time_log' AND column_name = 'activity_id'")
+        return cur.fetchone() is not None
+
+
+if __name__ == "__main__":
+    import psycopg2
+    database_url = os.getenv("DATABASE_URL") or (sys.argv[1] if len(sys.argv) > 1 else None)
+    if not database_url:
+        sys.exit("usage: DATABASE_URL=postgresql://... python activity_catalog.py [DATABASE_URL]")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    conn = psycopg2.connect(database_url)
+    try:
+        ensure_catalog(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,179 @@
+# ------------------------
+# 🧊 User × day × activity-group cube for the dashboard
+# ------------------------
+# Built once per data version from the (user, date, activity) totals.  Minutes
+# and entry counts are stored as prefix sums along the day axis, so any date
+# range is two lookups per cell.  A second prefix sum that only accumulates
+# every 7th day answers day-of-week questions the same way.  Every dashboard
+# view is then a slice of these arrays instead of a re-filter and group-by of
+# the rows.
+import numpy as np
+import pandas as pd
+import analytics
+
+ATE = "__ate__"  # entries logged as just "ate": counted per user, hidden everywhere else
+
+
+def _prefix(cube):
+    # Prefix sum along the day axis with a leading zero day: P[:, k] = sum of days < k
+    shape = (cube.shape[0], 1) + cube.shape[2:]
+    return np.concatenate([np.zeros(shape, dtype=np.int64), np.cumsum(cube, axis=1, dtype=np.int64)], axis=1)
+
+
+def _weekly_prefix(cube):
+    # W[:, k] = sum of days j <= k with j ≡ k (mod 7)
+    users, days = cube.shape[:2]
+    padded_days = -(-days // 7) * 7
+    padded = np.zeros((users, padded_days) + cube.shape[2:], dtype=np.int64)
+    padded[:, :days] = cube
+    weeks = padded.reshape((users, padded_days // 7, 7) + cube.shape[2:])
+    return np.cumsum(weeks, axis=1).reshape(padded.shape)[:, :days]
+
+
+class ActivityCube:
+    def __init__(self, daily, group_map):
+        # ``daily``: user_id, date, activity, minutes, entries (see analytics.daily_activity_totals)
+        # ``group_map``: {normalized activity: activity group}
+        daily = daily.copy()
+        daily["date"] = pd.to_datetime(daily["date"]).dt.date
+        daily["group"] = daily["activity"].map(group_map)
+        daily.loc[daily["activity"] == "ate", "group"] = ATE
+        daily["group"] = daily["group"].fillna(daily["activity"].str.capitalize())
+        self.users = sorted(daily["user_id"].unique())
+        self.groups = sorted(g for g in daily["group"].unique() if g != ATE) + [ATE]
+        self.start = min(daily["date"]) if len(daily) else None
+        days = (max(daily["date"]) - self.start).days + 1 if len(daily) else 0
+        self.days = days
+        self._user_pos = {u: i for i, u in enumerate(self.users)}
+        self._group_pos = {g: i for i, g in enumerate(self.groups)}
+        u = daily["user_id"].map(self._user_pos).to_numpy()
+        d = np.array([(x - self.start).days for x in daily["date"]], dtype=np.int64)
+        g = daily["group"].map(self._group_pos).to_numpy()
+        minutes = np.zeros((len(self.users), days, len(self.groups)), dtype=np.int64)
+        entries = np.zeros_like(minutes)
+        np.add.at(minutes, (u, d, g), daily["minutes"].to_numpy(dtype=np.int64))
+        np.add.at(entries, (u, d, g), daily["entries"].to_numpy(dtype=np.int64))
+        self.group_map = dict(group_map)
+        # Per user and day, all groups except ate (for the daily trend)
+        self.day_minutes = minutes[:, :, :-1].sum(axis=2)
+        self.day_entries = entries[:, :, :-1].sum(axis=2)
+        self.minutes_prefix = _prefix(minutes)
+        self.entries_prefix = _prefix(entries)
+        self.minutes_weekly = _weekly_prefix(minutes)
+        self.entries_weekly = _weekly_prefix(entries)
+
+    @classmethod
+    def from_daily(cls, daily):
+        active = daily[daily["activity"] != "ate"]
+        activities = active.groupby("activity")["entries"].sum().reset_index()
+        return cls(daily, analytics.activity_groups(activities))
+
+    # ------------------------
+    # Index helpers
+    # ------------------------
+    def _users(self, user_ids):
+        return [self._user_pos[u] for u in user_ids if u in self._user_pos]
+
+    def _days(self, start_date, end_date):
+        # Inclusive [a, b] day positions clipped to the cube, or None if disjoint
+        if self.start is None:
+            return None
+        a = max(0, (start_date - self.start).days)
+        b = min(self.days - 1, (end_date - self.start).days)
+        return (a, b) if a <= b else None
+
+    def _weekday_sum(self, weekly, users, days):
+        # (7, groups) sums over the range, rows are pandas dayofweek (0=Monday)
+        a, b = days
+        out = np.zeros((7,) + weekly.shape[2:], dtype=np.int64)
+        offset = self.start.weekday()
+        for r in range(7):
+            first = a + (r - a) % 7
+            if first > b:
+                continue
+            last = b - (b - r) % 7
+            total = weekly[users, last] - (weekly[users, first - 7] if first >= 7 else 0)
+            out[(offset + r) % 7] = total.sum(axis=0)
+        return out
+
+    # ------------------------
+    # Dashboard views
+    # ------------------------
+    def aggregates(self, user_ids, start_date, end_date):
+        # Same shape as the dashboard expects: per-user totals, group totals,
+        # daily trend, weekday heatmap, plus entries/users/num_days
+        users = self._users(user_ids)
+        days = self._days(start_date, end_date)
+        empty = {
+            "per_user": pd.DataFrame(columns=["user_id", "minutes", "active_minutes", "entries"]),
+            "groups": pd.DataFrame(columns=["Activity Group", "minutes", "entries"]),
+            "daily": pd.DataFrame(columns=["date", "minutes"]),
+            "weekday": pd.DataFrame(columns=["Activity Group", "dow", "minutes", "entries"]),
+            "entries": 0, "users": 0, "num_days": 0,
+        }
+        if not users or days is None:
+            return empty
+        a, b = days
+        ate = self._group_pos[ATE]
+        # Per user: (users, groups) over the range
+        user_minutes = self.minutes_prefix[users, b + 1] - self.minutes_prefix[users, a]
+        user_entries = self.entries_prefix[users, b + 1] - self.entries_prefix[users, a]
+        per_user = pd.DataFrame({
+            "user_id": [self.users[i] for i in users],
+            "minutes": user_minutes.sum(axis=1),
+            "active_minutes": user_minutes.sum(axis=1) - user_minutes[:, ate],
+            "entries": user_entries.sum(axis=1),
+        })
+        per_user = per_user[per_user["entries"] > 0].reset_index(drop=True)
+        if per_user.empty:
+            return empty
+        # Per group (ate excluded)
+        groups = pd.DataFrame({
+            "Activity Group": self.groups[:-1],
+            "minutes": user_minutes.sum(axis=0)[:-1],
+            "entries": user_entries.sum(axis=0)[:-1],
+        })
+        groups = groups[groups["entries"] > 0].reset_index(drop=True)
+        # Daily trend: one value per day that has entries (ate excluded)
+        day_minutes = self.day_minutes[users, a:b + 1].sum(axis=0)
+        day_entries = self.day_entries[users, a:b + 1].sum(axis=0)
+        has_entries = day_entries > 0
+        dates = pd.date_range(self.start, periods=self.days)[a:b + 1]
+        daily = pd.DataFrame({"date": dates[has_entries].date, "minutes": day_minutes[has_entries]})
+        # Day-of-week heatmap
+        week_minutes = self._weekday_sum(self.minutes_weekly, users, days)[:, :-1]
+        week_entries = self._weekday_sum(self.entries_weekly, users, days)[:, :-1]
+        dow, group = np.nonzero(week_entries)
+        weekday = pd.DataFrame({
+            "Activity Group": [self.groups[i] for i in group],
+            "dow": dow,
+            "minutes": week_minutes[dow, group],
+            "entries": week_entries[dow, group],
+        })
+        return {
+            "per_user": per_user,
+            "groups": groups,
+            "daily": daily,
+            "weekday": weekday,
+            "entries": int(per_user["entries"].sum()),
+            "users": int(len(per_user)),
+            "num_days": int(has_entries.sum()),
+        }
+
+    def group_daily(self, user_ids, start_date, end_date, group):
+        # Minutes per day for one activity group (days with entries only)
+        users = self._users(user_ids)
+        days = self._days(start_date, end_date)
+        if not users or days is None or group not in self._group_pos:
+            return pd.DataFrame(columns=["date", "minutes"])
+        a, b = days
+        g = self._group_pos[group]
+        minutes = np.diff(self.minutes_prefix[users, a:b + 2, g], axis=1).sum(axis=0)
+        entries = np.diff(self.entries_prefix[users, a:b + 2, g], axis=1).sum(axis=0)
+        dates = pd.date_range(self.start, periods=self.days)[a:b + 1]
+        keep = entries > 0
+        return pd.DataFrame({"date": dates[keep].date, "minutes": minutes[keep]})
+
+    def activities_in_group(self, group):
+        # Normalized activity strings that were grouped as ``group``
+        return tuple(sorted(a for a, g in self.group_map.items() if g == group))
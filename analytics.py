@@ -0,0 +1,299 @@
+# ------------------------
+# 📈 Dashboard aggregation layer
+# ------------------------
+# Every dashboard view (trend line, per-user totals, top activities, day-of-week
+# heatmap) is built from per (user, date, activity) totals.  When the data
+# lives in Postgres the totals are computed with GROUP BY on the server so
+# only the aggregated rows cross the wire; when we are on the CSV fallback the
+# same frame is computed with pandas.  Callers pass either a psycopg2
+# connection or a DataFrame as the ``source`` and get identical results back.
+import re
+import numpy as np
+import pandas as pd
+from psycopg2.extras import RealDictCursor
+
+SLEEP_KEYWORDS = ["sleep", "slept", "sleeping", "i was sleeping", "nap", "bed", "rest"]
+EAT_KEYWORDS = ["eat", "breakfast", "lunch", "dinner", "snack", "food", "meal"]
+
+# List of common stopwords to ignore in grouping
+STOPWORDS = set([
+    "i", "to", "the", "a", "an", "and", "of", "in", "on", "for", "with", "at", "by", "from", "up", "about", "into", "over", "after", "is", "it", "my", "me", "do", "did", "am", "are", "was", "were", "be", "been", "being", "have", "has", "had", "will", "would", "can", "could", "should", "shall", "may", "might", "must", "that", "this", "these", "those", "as", "but", "if", "or", "because", "so", "just", "not", "no", "yes", "you", "your", "we", "our", "us", "they", "their", "them", "he", "she", "his", "her", "him", "its", "who", "whom", "which", "what", "when", "where", "why", "how"
+])
+
+# Only the first 50 most frequent activities are compared when grouping by shared word
+GROUP_SAMPLE_SIZE = 50
+
+# "H:MM-H:MM" with optional spaces, same inputs datetime.strptime("%H:%M") accepts
+TIME_RANGE_RE = r"^\s*([01]?\d|2[0-3]):([0-5]?\d)\s*-\s*([01]?\d|2[0-3]):([0-5]?\d)\s*$"
+SLEEP_RE = "sleep|slept|nap|bed|rest"
+MAX_RANGE_MINUTES = 720  # longer ranges are taken as typos and count 0
+
+# ------------------------
+# Duration parsing
+# ------------------------
+def _time_text(times):
+    return pd.Series(times, dtype="object").fillna("").astype(str)
+
+
+def time_range_bounds(times):
+    # (start, end) minute-of-day Series for "H:MM-H:MM" ranges, NaN where the text is not a range
+    parts = _time_text(times).str.extract(TIME_RANGE_RE).astype(float)
+    return parts[0] * 60 + parts[1], parts[2] * 60 + parts[3]
+
+
+def duration_minutes(times):
+    # Vectorized version of the dashboard's time-to-minutes rule:
+    # ranges wrap overnight and are dropped above 12h, bare times count 5 min
+    # (540 if they mention sleep), anything unparseable counts 0.
+    t = _time_text(times)
+    start, end = time_range_bounds(t)
+    span = (end - start + 1439) % 1440 + 1
+    span = span.where(span.isna() | (span <= MAX_RANGE_MINUTES), 0)
+    blank = t.str.strip().eq("").to_numpy()
+    has_dash = t.str.contains("-", regex=False).to_numpy()
+    sleepish = t.str.lower().str.contains(SLEEP_RE).to_numpy()
+    single = np.where(sleepish, 540, 5)
+    minutes = np.where(span.notna(), span.fillna(0), np.where(blank | has_dash, 0, single))
+    return pd.Series(minutes, index=t.index).astype(int)
+
+
+def normalize_activity(activities):
+    return pd.Series(activities, dtype="object").fillna("").astype(str).str.strip().str.lower()
+
+
+# SQL twin of duration_minutes(); ``%%`` because it is run with bound parameters
+_RANGE_SPAN_SQL = r"""
+    CASE WHEN time ~ '{range_re}' THEN
+        ((split_part(split_part(time, '-', 2), ':', 1)::int * 60 + split_part(split_part(time, '-', 2), ':', 2)::int)
+         - (split_part(split_part(time, '-', 1), ':', 1)::int * 60 + split_part(split_part(time, '-', 1), ':', 2)::int)
+         + 1439) %% 1440 + 1
+    END
+""".format(range_re=TIME_RANGE_RE)
+
+DURATION_SQL = r"""
+    CASE
+        WHEN span IS NOT NULL THEN CASE WHEN span > {max_range} THEN 0 ELSE span END
+        WHEN time IS NULL OR btrim(time) = '' THEN 0
+        WHEN position('-' in time) > 0 THEN 0
+        WHEN lower(time) ~ '{sleep_re}' THEN 540
+        ELSE 5
+    END
+""".format(sleep_re=SLEEP_RE, max_range=MAX_RANGE_MINUTES)
+
+
+def _entries_cte(columns=""):
+    # ``columns``: extra time_log columns to carry through, e.g. ", activity_id"
+    return f"""
+    WITH parsed AS (
+        SELECT user_id, date, time, what_i_did{columns}, {_RANGE_SPAN_SQL} AS span
+        FROM time_log
+        WHERE user_id = ANY(%(user_ids)s) AND date BETWEEN %(start_date)s AND %(end_date)s
+    ), entries AS (
+        SELECT user_id, date, time, what_i_did{columns},
+               lower(btrim(coalesce(what_i_did, ''), E' \\t\\r\\n')) AS activity,
+               {DURATION_SQL} AS duration
+        FROM parsed
+    )
+"""
+
+
+_ENTRIES_CTE = _entries_cte()
+_CATALOG_ENTRIES_CTE = _entries_cte(", activity_id")
+
+_DAILY_ACTIVITY_SQL = """
+    SELECT user_id, date, activity, SUM(duration) AS minutes, COUNT(*) AS entries
+    FROM entries GROUP BY user_id, date, activity
+"""
+
+# Grouped by the integer catalog id (see activity_catalog) where one is set, by
+# the text for rows the backfill hasn't reached yet; the catalog text is looked
+# up once per distinct id
+_CATALOG_DAILY_ACTIVITY_SQL = """
+    SELECT d.user_id, d.date, coalesce(c.activity, d.activity) AS activity, d.minutes, d.entries
+    FROM (
+        SELECT user_id, date, activity_id, CASE WHEN activity_id IS NULL THEN activity END AS activity,
+               SUM(duration) AS minutes, COUNT(*) AS entries
+        FROM entries GROUP BY 1, 2, 3, 4
+    ) d LEFT JOIN activity_catalog c ON c.id = d.activity_id
+"""
+
+DAILY_ACTIVITY_COLUMNS = ["user_id", "date", "activity", "minutes", "entries"]
+
+
+def _is_frame(source):
+    return isinstance(source, pd.DataFrame)
+
+
+def _query(conn, sql, params):
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+
+def _frame(rows, columns):
+    return pd.DataFrame(rows, columns=columns) if rows else pd.DataFrame(columns=columns)
+
+
+def _params(user_ids, start_date, end_date, **extra):
+    return {"user_ids": list(user_ids), "start_date": start_date, "end_date": end_date, **extra}
+
+
+def _entries_frame(df, user_ids, start_date, end_date):
+    # Pandas twin of the ``entries`` CTE above
+    if df.empty:
+        return pd.DataFrame(columns=["user_id", "date", "Date", "Time", "What I Did", "activity", "duration"])
+    out = df.copy()
+    out["Date"] = pd.to_datetime(out["Date"], errors="coerce")
+    out = out.dropna(subset=["Date"])
+    out["date"] = out["Date"].dt.date
+    out = out[out["user_id"].isin(list(user_ids)) & (out["date"] >= start_date) & (out["date"] <= end_date)]
+    out["activity"] = normalize_activity(out["What I Did"])
+    out["duration"] = duration_minutes(out["Time"])
+    return out
+
+
+# ------------------------
+# Public API
+# ------------------------
+def date_bounds(source, user_ids):
+    # (min_date, max_date) of the selected users' entries, or None when empty
+    if _is_frame(source):
+        dates = pd.to_datetime(source.loc[source["user_id"].isin(list(user_ids)), "Date"], errors="coerce").dropna()
+        if dates.empty:
+            return None
+        return dates.min().date(), dates.max().date()
+    rows = _query(source, "SELECT MIN(date) AS min_date, MAX(date) AS max_date FROM time_log WHERE user_id = ANY(%(user_ids)s)", {"user_ids": list(user_ids)})
+    if not rows or rows[0]["min_date"] is None:
+        return None
+    return rows[0]["min_date"], rows[0]["max_date"]
+
+
+def daily_activity_totals(source, user_ids, start_date, end_date, use_catalog=False):
+    # Minutes and entry counts per (user_id, date, normalized activity); every
+    # dashboard view is derived from this frame (see activity_cube.ActivityCube).
+    # ``use_catalog``: group by time_log.activity_id in Postgres (only once the
+    # activity_catalog migration has run); same result either way
+    if _is_frame(source):
+        entries = _entries_frame(source, user_ids, start_date, end_date)
+        # Dictionary-encode the activity text so the group-by runs on integer codes
+        codes, catalog = pd.factorize(entries["activity"])
+        entries["activity_id"] = codes
+        daily = entries.groupby(["user_id", "date", "activity_id"]).agg(minutes=("duration", "sum"), entries=("duration", "size")).reset_index()
+        if daily.empty:
+            daily = pd.DataFrame(columns=DAILY_ACTIVITY_COLUMNS)
+        else:
+            daily["activity"] = np.asarray(catalog, dtype=object)[daily["activity_id"].to_numpy()]
+            daily = daily[DAILY_ACTIVITY_COLUMNS]
+    else:
+        sql = _CATALOG_ENTRIES_CTE + _CATALOG_DAILY_ACTIVITY_SQL if use_catalog else _ENTRIES_CTE + _DAILY_ACTIVITY_SQL
+        daily = _frame(_query(source, sql, _params(user_ids, start_date, end_date)), DAILY_ACTIVITY_COLUMNS)
+    daily[["minutes", "entries"]] = daily[["minutes", "entries"]].apply(pd.to_numeric).fillna(0).astype(int)
+    return daily
+
+
+def activity_entries(source, user_ids, start_date, end_date, activities):
+    # Raw rows (Date, Time, What I Did, Duration) for a set of normalized activity strings
+    columns = ["Date", "Time", "What I Did", "Duration"]
+    activities = list(activities)
+    if not activities:
+        return pd.DataFrame(columns=columns)
+    if _is_frame(source):
+        entries = _entries_frame(source, user_ids, start_date, end_date)
+        entries = entries[entries["activity"].isin(activities)]
+        rows = entries.rename(columns={"duration": "Duration"})[columns]
+    else:
+        sql = _ENTRIES_CTE + """
+            SELECT date AS "Date", time AS "Time", what_i_did AS "What I Did", duration AS "Duration"
+            FROM entries WHERE activity = ANY(%(activities)s) ORDER BY date, time
+        """
+        rows = _frame(_query(source, sql, _params(user_ids, start_date, end_date, activities=activities)), columns)
+    rows["Date"] = pd.to_datetime(rows["Date"], errors="coerce")
+    return rows.sort_values(by=["Date", "Time"]).reset_index(drop=True)
+
+
+# ------------------------
+# Trend charts
+# ------------------------
+# Finest resolution whose bucket count over the selected span stays within
+# MAX_TREND_POINTS, so plotting cost doesn't grow with the date range
+MAX_TREND_POINTS = 120
+TREND_RESOLUTIONS = [("Day", "D", "D"), ("Week", "W-SUN", "W-SUN"), ("Month", "M", "MS"), ("Quarter", "Q", "QS")]
+
+
+def trend_resolution(start_date, end_date, max_points=MAX_TREND_POINTS):
+    # (name, resample rule) for a date span
+    for name, period, rule in TREND_RESOLUTIONS:
+        if len(pd.period_range(start_date, end_date, freq=period)) <= max_points:
+            return name, rule
+    return TREND_RESOLUTIONS[-1][0], TREND_RESOLUTIONS[-1][2]
+
+
+def resample_trend(daily, start_date, end_date, max_points=MAX_TREND_POINTS):
+    # (minutes Series on a DatetimeIndex, resolution name) for a (date, minutes)
+    # frame; buckets without entries are NaN so the line shows a gap (the chart
+    # marks every point, so isolated buckets still show up)
+    name, rule = trend_resolution(start_date, end_date, max_points)
+    if daily.empty:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([])), name
+    series = pd.Series(daily["minutes"].to_numpy(dtype=float), index=pd.to_datetime(daily["date"])).sort_index()
+    trend = series.resample(rule).sum(min_count=1)
+    return trend.iloc[-max_points:], name
+
+
+# ------------------------
+# Activity grouping
+# ------------------------
+def is_eating(activity):
+    activity_lower = str(activity).lower()
+    return any(kw in activity_lower for kw in EAT_KEYWORDS)
+
+
+def is_sleep(activity):
+    activity_lower = str(activity).lower()
+    return any(kw in activity_lower for kw in SLEEP_KEYWORDS)
+
+
+def group_activity(activity, sample_activities):
+    activity_lower = str(activity).lower()
+    # Map any activity containing 'ate' (as a word or substring) to 'Eating'
+    if 'ate' in activity_lower.split() or 'ate' in activity_lower:
+        return "Eating"
+    if is_eating(activity):
+        return "Eating"
+    if is_sleep(activity):
+        return "Sleep"
+    # Custom grouping: 'track', 'field', 'school' all as 'School'
+    school_keywords = {"track", "field", "school"}
+    words = set(w for w in re.findall(r"\w+", activity_lower))
+    if words & school_keywords:
+        return "School"
+    # Custom grouping: 'home' as 'Homework'
+    if "home" in words:
+        return "Homework"
+    # Tokenize and filter out stopwords
+    words = set(w for w in re.findall(r"\w+", activity_lower) if w not in STOPWORDS)
+    if not words:
+        words = set(re.findall(r"\w+", activity_lower))
+    for other in sample_activities:
+        other_lower = str(other).lower()
+        if other == activity:
+            continue
+        other_words = set(w for w in re.findall(r"\w+", other_lower) if w not in STOPWORDS)
+        if words & other_words:
+            return sorted(words & other_words)[0].capitalize()
+    if words:
+        # Prevent 'Ate' as a group label
+        first_word = sorted(words)[0].capitalize()
+        if first_word == "Ate":
+            return "Eating"
+        return first_word
+    return str(activity).strip().capitalize()
+
+
+def activity_groups(activities):
+    # {normalized activity: group} for the "activities" aggregate frame; grouping
+    # runs once per distinct activity instead of once per row
+    if activities.empty:
+        return {}
+    sample = activities.sort_values("entries", ascending=False).head(GROUP_SAMPLE_SIZE)["activity"].tolist()
+    return {a: group_activity(a, sample) for a in activities["activity"]}
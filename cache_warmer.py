@@ -0,0 +1,178 @@
+# ------------------------
+# 🔥 Background cache warming for active users
+# ------------------------
+# Page loads report who is active (and which dashboard selections they look
+# at).  A scheduler thread refreshes those users' caches every
+# REFRESH_INTERVAL, and right away after a write marks them dirty.
+#
+# Calling a cached loader doesn't refresh an entry that is still live, so the
+# warmed caches have no ttl of their own: they are keyed by a generation per
+# user (and per dashboard selection) that only the warmer advances.  A refresh
+# builds every entry for the next generation and then publishes it, so
+# readers keep hitting the previous entries until the new ones are ready; a
+# refresh never makes a request rebuild anything (a write still may, until the
+# warmer has caught up with it).
+#
+# The refreshes run on a small thread pool, so at most MAX_WORKERS users are
+# warmed at once and a burst of writes can't starve interactive requests of
+# database connections or CPU.  Users who have not loaded a page for
+# ACTIVE_WINDOW are dropped.
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE_WINDOW = 900.0  # seconds a user counts as active after their last page load
+REFRESH_INTERVAL = 45.0  # seconds between refreshes of an active user's caches
+TICK = 5.0  # seconds between scheduler passes
+MAX_WORKERS = 2
+MAX_DASHBOARDS = 3  # most recent dashboard selections kept warm per user
+
+
+class CacheWarmer:
+    def __init__(self, warm, max_workers=MAX_WORKERS):
+        # ``warm(user_id, dashboards, generations)`` builds one user's caches;
+        # ``dashboards`` are the user-id tuples of their recent dashboard
+        # selections and ``generations`` maps the user_id and each dashboard to
+        # the generation to build them for; it returns False if it built nothing
+        # (then the current generations stay in use)
+        self.warm = warm
+        self.max_workers = max_workers
+        self.runs = 0
+        self.failures = 0
+        self.last_error = None
+        self._users = {}  # user_id -> {"last_seen", "dashboards", "warmed_at", "dirty", "seconds"}
+        # user_id or dashboard tuple -> generation of its warmed cache entries; never
+        # reset, an idle user's old entries must not become current again
+        self._generations = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-warm")
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------------
+    # Request side (Streamlit request threads)
+    # ------------------------
+    def touch(self, user_id, dashboard=None):
+        # Records a page load by ``user_id`` (and the dashboard selection they viewed)
+        with self._lock:
+            user = self._users.setdefault(user_id, {"last_seen": 0.0, "dashboards": [], "warmed_at": 0.0, "dirty": False, "seconds": None})
+            user["last_seen"] = time.time()
+            if dashboard is not None:
+                dashboard = tuple(dashboard)
+                if dashboard in user["dashboards"]:
+                    user["dashboards"].remove(dashboard)
+                user["dashboards"] = (user["dashboards"] + [dashboard])[-MAX_DASHBOARDS:]
+
+    def generation(self, key):
+        # Generation the caches of ``key`` (a user_id or a dashboard's user-id tuple) are read at
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def mark_dirty(self, user_ids=None):
+        # After a write: refresh these users (all active users if None), and
+        # anyone whose recent dashboards include them, on the next pass
+        written = None if user_ids is None else set(user_ids)
+        with self._lock:
+            for user_id, user in self._users.items():
+                if written is None or user_id in written or any(written.intersection(d) for d in user["dashboards"]):
+                    user["dirty"] = True
+        self._wake.set()
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            users = [{
+                "user_id": user_id,
+                "idle_seconds": round(now - u["last_seen"]),
+                "warmed_seconds_ago": round(now - u["warmed_at"]) if u["warmed_at"] else None,
+                "last_warm_seconds": u["seconds"],
+                "dashboards": len(u["dashboards"]),
+                "warming": user_id in self._in_flight,
+            } for user_id, u in self._users.items()]
+            return {
+                "active_users": len(users),
+                "warming": len(self._in_flight),
+                "runs": self.runs,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "running": bool(self._thread and self._thread.is_alive()),
+                "users": users,
+            }
+
+    # ------------------------
+    # Scheduler side
+    # ------------------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._pool.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._schedule()
+            except Exception as e:
+                logging.error(f"Cache warmer pass failed: {e}")
+            self._wake.wait(TICK)
+            self._wake.clear()
+
+    def _schedule(self):
+        now = time.time()
+        with self._lock:
+            for user_id in [u for u, info in self._users.items() if now - info["last_seen"] > ACTIVE_WINDOW]:
+                if user_id not in self._in_flight:
+                    del self._users[user_id]
+            # Dirty users first, then the longest-unrefreshed
+            due = sorted(
+                (u for u, info in self._users.items()
+                 if u not in self._in_flight and (info["dirty"] or now - info["warmed_at"] >= REFRESH_INTERVAL)),
+                key=lambda u: (not self._users[u]["dirty"], self._users[u]["warmed_at"]),
+            )
+            # Never queue more than the pool can run, so backlog can't pile up
+            due = due[:max(0, self.max_workers - len(self._in_flight))]
+            jobs = []
+            for user_id in due:
+                user = self._users[user_id]
+                user["dirty"] = False
+                self._in_flight.add(user_id)
+                jobs.append((user_id, list(user["dashboards"])))
+        for user_id, dashboards in jobs:
+            self._pool.submit(self._warm_one, user_id, dashboards)
+
+    def _warm_one(self, user_id, dashboards):
+        started = time.perf_counter()
+        with self._lock:
+            generations = {key: self._generations.get(key, 0) + 1 for key in [user_id] + dashboards}
+        try:
+            built = self.warm(user_id, dashboards, generations) is not False
+            error = None
+        except Exception as e:
+            error = e
+            logging.warning(f"Warming caches for user {user_id} failed: {e}")
+        seconds = round(time.perf_counter() - started, 3)
+        with self._lock:
+            # Readers switch to the new entries only once all of them are built
+            if error is None and built:
+                for key, generation in generations.items():
+                    self._generations[key] = max(generation, self._generations.get(key, 0))
+            self._in_flight.discard(user_id)
+            self.runs += 1
+            if error is not None:
+                self.failures += 1
+                self.last_error = str(error)
+            user = self._users.get(user_id)
+            if user is not None:
+                user["warmed_at"] = time.time()
+                user["seconds"] = seconds
+        logging.debug(f"DEBUG: Warmed caches for user {user_id} in {seconds:.3f}s")
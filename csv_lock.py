@@ -0,0 +1,35 @@
+# ------------------------
+# 🔒 Exclusive access to the time log CSV
+# ------------------------
+# The app's offline edits/deletes and the background purge all rewrite
+# time_log.csv.  Each writer holds locked(path) for its whole read-modify-write
+# (a thread lock plus an flock on <csv>.lock, so it covers every worker process
+# on the host) and swaps the new contents in with write_atomic(), so no writer
+# loses another's changes and readers never see a half-written file.
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialised
+    fcntl = None
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def locked(path):
+    with _lock:
+        with open(f"{path}.lock", "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            # Closing the file releases the flock
+            yield
+
+
+def write_atomic(df, path):
+    # Writes ``df`` next to ``path`` and replaces it in one step; call under locked(path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
@@ -0,0 +1,119 @@
+# ------------------------
+# 📅 Per-user date index for View Charts
+# ------------------------
+# A user's entries are parsed and sorted by day once (per data version), and
+# each row's chart duration is computed once.  Every day then owns one
+# contiguous row range, so picking a date in the date picker is a dict lookup
+# plus a slice instead of re-parsing every date of the user's history.  The
+# day's pie breakdown (overlap-aware minutes per entry) is computed the first
+# time the day is shown and kept with the index.
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from interval_index import IntervalIndex
+
+SLEEP_KEYWORDS = ["sleep", "slept", "sleeping", "i was sleeping", "nap", "bed", "rest"]
+
+
+def chart_minutes(t, what_i_did):
+    # Minutes one entry contributes to the View Charts pie
+    try:
+        # Handle empty or None values
+        if not t or pd.isna(t):
+            return 0
+
+        t_lower = str(t).lower().strip()
+        # Use actual time range for all sleep-related activities
+        is_sleep = any(kw in t_lower for kw in SLEEP_KEYWORDS)
+
+        # Handle single time values (like "7:30" without range)
+        if "-" not in t:
+            # For single time values, default to 5 minutes (or 540 for sleep)
+            return 540 if is_sleep else 5
+
+        # Process time ranges
+        start, end = str(t).split("-", 1)  # Split only on first dash
+        start = start.strip()
+        end = end.strip()
+
+        # Handle cases like "5:30 -7:31" with inconsistent spacing
+        s = datetime.strptime(start, "%H:%M")
+        e = datetime.strptime(end, "%H:%M")
+
+        # Handle overnight (end < start)
+        if e <= s:
+            e = e + timedelta(days=1)
+
+        duration = int((e - s).total_seconds() / 60)
+
+        # Validate duration ranges
+        if duration <= 0:
+            return 0
+        if is_sleep:
+            if duration > 960:  # More than 16 hours of sleep is unrealistic
+                return 0
+        else:
+            if duration > 720:  # More than 12 hours for other activities is unrealistic
+                return 0
+        return duration
+    except Exception as e:
+        # Log the error for debugging
+        logging.warning(f"Error parsing time '{t}': {e}")
+        # Return default values based on activity type
+        is_sleep = any(kw in str(what_i_did).lower() for kw in SLEEP_KEYWORDS) if what_i_did else False
+        return 540 if is_sleep else 5
+
+
+class DateIndex:
+    def __init__(self, df):
+        # ``df``: one user's time log (Date, Time, What I Did); rows without a
+        # parseable date are left out
+        dates = pd.to_datetime(df["Date"], errors="coerce")
+        valid = dates.notna().to_numpy()
+        days = dates[valid].to_numpy().astype("datetime64[D]")
+        order = np.argsort(days, kind="stable")
+        self.df = df[valid].iloc[order].reset_index(drop=True)
+        self.df["Duration"] = [chart_minutes(t, w) for t, w in zip(self.df["Time"], self.df["What I Did"])]
+        unique_days, starts = np.unique(days[order], return_index=True)
+        # Rows of self.days[i] are self.df.iloc[self.offsets[i]:self.offsets[i + 1]]
+        self.days = list(unique_days.astype(object))
+        self.offsets = np.append(starts, len(self.df))
+        self._pos = {d: i for i, d in enumerate(self.days)}
+        self._breakdowns = {}
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def first_day(self):
+        return self.days[0] if self.days else None
+
+    @property
+    def last_day(self):
+        return self.days[-1] if self.days else None
+
+    def rows(self, day):
+        # The day's entries (Date, Time, What I Did, Duration, ...), empty if none
+        i = self._pos.get(day)
+        if i is None:
+            return self.df.iloc[0:0]
+        return self.df.iloc[self.offsets[i]:self.offsets[i + 1]]
+
+    def breakdown(self, day):
+        # (minutes per "What I Did (Time)" label, covered minutes) for the day's pie;
+        # overlapping ranges share the overlapped minutes instead of counting them twice
+        if day not in self._breakdowns:
+            day_df = self.rows(day)
+            day_df = day_df[day_df["Duration"] > 0].copy()
+            day_index = IntervalIndex.from_frame(day_df)
+            attributed = pd.Series(day_index.attributed_minutes(), dtype=float)
+            day_df["Duration"] = day_df["Duration"].astype(float)
+            day_df.loc[attributed.index, "Duration"] = attributed
+            day_df["Label"] = day_df["What I Did"] + " (" + day_df["Time"] + ")"
+            self._breakdowns[day] = (day_df.groupby("Label")["Duration"].sum(), day_index.covered_minutes())
+        return self._breakdowns[day]
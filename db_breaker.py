@@ -0,0 +1,229 @@
+# ------------------------
+# 🔌 Circuit breaker around the Postgres connection
+# ------------------------
+# closed    -> normal operation, connections come from a thread-safe pool
+# open      -> the database is considered down; callers get None immediately
+#              and use their local fallback (CSV reads, queued writes)
+# half_open -> the background probe is trying the database again
+# disabled  -> no database is configured (conn_params None); always offline
+#
+# Connects use a bounded connect_timeout and every session gets a
+# statement_timeout, so an unreachable or stuck server costs seconds once
+# instead of the OS TCP timeout on every rerun.
+#
+# connection() returns a handle rather than a connection: ``with handle as
+# conn`` checks a connection out of the pool for one transaction (commit on
+# success, rollback on error, just like ``with conn``) and returns it after,
+# so concurrent sessions never enter the same psycopg2 connection.
+import logging
+import os
+import threading
+import time
+import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+DISABLED = "disabled"
+
+CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))  # seconds
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+FAILURE_THRESHOLD = 3  # consecutive query-level connection errors before opening
+PROBE_INTERVAL = 5.0  # seconds between health probes while open
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # connections shared by a process's sessions
+POOL_WAIT = 5.0  # seconds a session waits for a free pooled connection
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class PooledConnection:
+    # The handle CircuitBreaker.connection() returns (see the header)
+    def __init__(self, breaker):
+        self.breaker = breaker
+        self._local = threading.local()
+
+    def __enter__(self):
+        pool, conn = self.breaker._checkout()
+        try:
+            entered = conn.__enter__()
+        except Exception:
+            self.breaker._checkin(pool, conn, broken=True)
+            raise
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = []
+        held.append((pool, conn))
+        return entered
+
+    def __exit__(self, exc_type, exc, tb):
+        pool, conn = self._local.held.pop()
+        broken = isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        try:
+            return conn.__exit__(exc_type, exc, tb)
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.breaker._checkin(pool, conn, broken)
+
+
+class CircuitBreaker:
+    def __init__(self, conn_params, failure_threshold=FAILURE_THRESHOLD, probe_interval=PROBE_INTERVAL, pool_size=POOL_SIZE):
+        if conn_params is None:
+            self.conn_params = None
+        else:
+            self.conn_params = dict(conn_params)
+            self.conn_params.setdefault("connect_timeout", CONNECT_TIMEOUT)
+            self.conn_params.setdefault("options", f"-c statement_timeout={STATEMENT_TIMEOUT_MS}")
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = CLOSED if conn_params is not None else DISABLED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.pool_size = pool_size
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._handle = PooledConnection(self)
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self._stop = threading.Event()
+
+    # ------------------------
+    # Connections
+    # ------------------------
+    def _connect(self):
+        return psycopg2.connect(**self.conn_params)
+
+    def new_connection(self):
+        # A private connection (for background threads); raises CircuitOpenError while open
+        if self.state != CLOSED:
+            raise CircuitOpenError(f"database circuit is {self.state}")
+        try:
+            return self._connect()
+        except Exception as e:
+            self._trip(e)
+            raise
+
+    def connection(self):
+        # A pooled connection handle, or None while the breaker is open or the connect fails
+        if self.state != CLOSED:
+            return None
+        with self._lock:
+            if self._pool is None:
+                try:
+                    self._pool = ThreadedConnectionPool(1, self.pool_size, **self.conn_params)
+                except Exception as e:
+                    self._trip(e)
+                    return None
+        return self._handle
+
+    def _checkout(self):
+        # (pool, connection); waits up to POOL_WAIT for a free slot
+        if not self._slots.acquire(timeout=POOL_WAIT):
+            raise PoolError(f"no free database connection after {POOL_WAIT:.0f}s")
+        pool = self._pool
+        try:
+            if pool is None:
+                raise CircuitOpenError(f"database circuit is {self.state}")
+            return pool, pool.getconn()
+        except Exception as e:
+            self._slots.release()
+            if isinstance(e, psycopg2.OperationalError):
+                self.record_error(e)
+            raise
+
+    def _checkin(self, pool, conn, broken=False):
+        # Broken connections are closed instead of reused; a pool closed by _trip just closes it
+        try:
+            if pool is self._pool:
+                pool.putconn(conn, close=broken or bool(conn.closed))
+            else:
+                conn.close()
+        except Exception:
+            pass
+        finally:
+            self._slots.release()
+
+    # ------------------------
+    # State transitions
+    # ------------------------
+    def record_error(self, error):
+        # Only connection-level failures count; bad SQL or timeouts of one query do not
+        if self.state == DISABLED:
+            return
+        if not isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            return
+        if isinstance(error, psycopg2.extensions.QueryCanceledError):
+            return
+        self.failures += 1
+        self.last_error = str(error)
+        if self.failures >= self.failure_threshold:
+            self._trip(error)
+
+    def record_success(self):
+        self.failures = 0
+
+    def _trip(self, error):
+        if self.state == DISABLED:
+            return
+        if self.state != OPEN:
+            logging.error(f"Database circuit opened: {error}")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.last_error = str(error)
+        self.failures = 0
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            try:
+                pool.closeall()
+            except Exception:
+                pass
+
+    def probe(self):
+        # One half-open trial: connect and SELECT 1; closes the breaker on success
+        self.state = HALF_OPEN
+        try:
+            conn = self._connect()
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+        except Exception as e:
+            self._trip(e)
+            return False
+        conn.close()
+        # connection() opens a fresh pool on the next request
+        with self._lock:
+            self.failures = 0
+            self.state = CLOSED
+        logging.info(f"Database circuit closed after {time.monotonic() - self.opened_at:.1f}s")
+        return True
+
+    # ------------------------
+    # Background health probe
+    # ------------------------
+    def start_probe(self):
+        if self.state == DISABLED or (self._probe_thread and self._probe_thread.is_alive()):
+            return
+        self._probe_thread = threading.Thread(target=self._run_probe, name="db-health-probe", daemon=True)
+        self._probe_thread.start()
+
+    def stop_probe(self, timeout=5):
+        self._stop.set()
+        if self._probe_thread:
+            self._probe_thread.join(timeout)
+
+    def _run_probe(self):
+        while not self._stop.wait(self.probe_interval):
+            if self.state == OPEN:
+                self.probe()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "last_error": self.last_error,
+            "open_for_seconds": time.monotonic() - self.opened_at if self.state != CLOSED and self.opened_at else 0.0,
+        }
@@ -0,0 +1,146 @@
+# ------------------------
+# ⏱ Interval index over a user's time log
+# ------------------------
+# Entries are parsed once into [start, end) minutes on an absolute timeline
+# (day ordinal * 1440 + minute of day), so overnight ranges like 21:00-02:00
+# simply run into the next day.  Intervals are kept sorted by start together
+# with a running maximum of the end times, which makes point and range
+# lookups a binary search plus the matching entries.  A sweep-line merge
+# gives the covered (union) time, so overlapping entries are counted once.
+# Ranges longer than analytics.MAX_RANGE_MINUTES count 0 in the dashboard and
+# the charts (typos like "12:01-1:00"), so they are not indexed either.
+import numpy as np
+import pandas as pd
+from datetime import datetime
+import analytics
+
+MINUTES_PER_DAY = 1440
+
+
+def _span(start, end):
+    # Length of a range in minutes; overnight (end <= start) runs into the next day
+    return (end - start + MINUTES_PER_DAY - 1) % MINUTES_PER_DAY + 1
+
+
+def to_minute(day, minute_of_day=0):
+    # Absolute minute for a date (or datetime) plus an offset in minutes
+    if isinstance(day, datetime):
+        minute_of_day += day.hour * 60 + day.minute
+        day = day.date()
+    return day.toordinal() * MINUTES_PER_DAY + int(minute_of_day)
+
+
+class IntervalIndex:
+    def __init__(self, starts, ends, labels):
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        labels = np.asarray(labels, dtype=object)
+        order = np.lexsort((ends, starts))
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.labels = labels[order]
+        # Non-decreasing, so "which intervals can still be running at t" is a binary search
+        self.max_end = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+        self.cover_starts, self.cover_ends = self._merge()
+        self.cover_total = np.concatenate([[0], np.cumsum(self.cover_ends - self.cover_starts)])
+
+    @classmethod
+    def from_frame(cls, df):
+        # Builds the index from a time log frame (Date, Time); rows whose Time is
+        # not an "H:MM-H:MM" range, or is longer than MAX_RANGE_MINUTES, are left
+        # out. Labels are the frame's index.
+        if df.empty:
+            return cls([], [], [])
+        days = pd.to_datetime(df["Date"], errors="coerce")
+        start, end = analytics.time_range_bounds(df["Time"])
+        valid = (days.notna() & (_span(start, end) <= analytics.MAX_RANGE_MINUTES)).to_numpy()
+        base = np.array([d.toordinal() for d in days[valid].dt.date], dtype=np.int64) * MINUTES_PER_DAY
+        start = start[valid].to_numpy(dtype=np.int64)
+        span = _span(start, end[valid].to_numpy(dtype=np.int64))
+        return cls(base + start, base + start + span, df.index[valid])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _merge(self):
+        # Sweep-line merge of the sorted intervals into disjoint covered segments
+        if not len(self.starts):
+            return self.starts, self.ends
+        # A new segment starts wherever an interval begins after everything before it ended
+        new_segment = np.ones(len(self.starts), dtype=bool)
+        new_segment[1:] = self.starts[1:] > self.max_end[:-1]
+        seg_ids = np.cumsum(new_segment) - 1
+        cover_starts = self.starts[new_segment]
+        cover_ends = np.zeros(len(cover_starts), dtype=np.int64)
+        np.maximum.at(cover_ends, seg_ids, self.ends)
+        return cover_starts, cover_ends
+
+    # ------------------------
+    # Lookups
+    # ------------------------
+    def at(self, minute):
+        # Labels of entries running at an absolute minute (see to_minute)
+        return self.overlapping(minute, minute + 1)
+
+    def overlapping(self, start, end):
+        # Labels of entries that overlap [start, end)
+        lo = np.searchsorted(self.max_end, start, side="right")
+        hi = np.searchsorted(self.starts, end, side="left")
+        if lo >= hi:
+            return []
+        hit = self.ends[lo:hi] > start
+        return list(self.labels[lo:hi][hit])
+
+    def covered_minutes(self, start=None, end=None):
+        # Minutes covered by at least one entry, optionally clipped to [start, end)
+        if not len(self.cover_starts):
+            return 0
+        total = int(self.cover_total[-1])
+        if start is None and end is None:
+            return total
+        start = self.cover_starts[0] if start is None else start
+        end = self.cover_ends[-1] if end is None else end
+        if end <= start:
+            return 0
+        return self._covered_before(end) - self._covered_before(start)
+
+    def _covered_before(self, minute):
+        i = np.searchsorted(self.cover_starts, minute, side="right")
+        if i == 0:
+            return 0
+        partial = min(minute, self.cover_ends[i - 1]) - self.cover_starts[i - 1]
+        return int(self.cover_total[i - 1] + partial)
+
+    def attributed_minutes(self):
+        # {label: minutes} where time covered by k overlapping entries is split k ways,
+        # so the values add up to covered_minutes() instead of double counting
+        if not len(self.starts):
+            return {}
+        points = np.unique(np.concatenate([self.starts, self.ends]))
+        widths = np.diff(points).astype(float)
+        # Number of entries active in each elementary segment [points[k], points[k+1])
+        active = (np.searchsorted(self.starts, points[:-1], side="right")
+                  - np.searchsorted(np.sort(self.ends), points[:-1], side="right"))
+        share = np.divide(widths, active, out=np.zeros_like(widths), where=active > 0)
+        share_prefix = np.concatenate([[0.0], np.cumsum(share)])
+        first = np.searchsorted(points, self.starts)
+        last = np.searchsorted(points, self.ends)
+        minutes = share_prefix[last] - share_prefix[first]
+        result = {}
+        for label, m in zip(self.labels, minutes):
+            result[label] = result.get(label, 0.0) + float(m)
+        return result
+
+
+
+def entry_span(day, time_text):
+    # (start, end) absolute minutes for one entry, or None if time_text is not a
+    # range the index would hold (see from_frame)
+    start, end = analytics.time_range_bounds([time_text])
+    if pd.isna(start.iloc[0]) or pd.isna(end.iloc[0]):
+        return None
+    start, end = int(start.iloc[0]), int(end.iloc[0])
+    span = _span(start, end)
+    if span > analytics.MAX_RANGE_MINUTES:
+        return None
+    return to_minute(day, start), to_minute(day, start + span)
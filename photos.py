@@ -0,0 +1,134 @@
+# ------------------------
+# 🖼️ Profile photo pipeline
+# ------------------------
+# Uploads are validated (size, real JPEG/PNG, pixel count), downscaled if
+# very large, and stored as <user>.<ext> like before.  At the same time the
+# 100px and 150px thumbnails the UI shows are rendered once and stored under
+# the upload's content hash (profile_photos/thumbs/<hash>_<size>.png), so a
+# page render only ever ships a few KB.  Thumbnail bytes are served from an
+# in-memory LRU; because the name is derived from the content, a cached
+# thumbnail can never be stale.  Photos uploaded before this existed get
+# their thumbnails generated on first view.
+import hashlib
+import logging
+import os
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from PIL import Image, ImageOps
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_PIXELS = 40_000_000  # refuse decompression bombs before decoding
+MAX_DIMENSION = 1024  # stored originals are downscaled to this on the longest side
+THUMB_SIZES = (100, 150)
+THUMB_DIR = "thumbs"
+THUMB_CACHE_SIZE = 256
+FORMATS = {"JPEG": "jpg", "PNG": "png"}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _open_image(data):
+    # Decoded image, or ValueError if ``data`` isn't a usable JPEG/PNG
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Photo is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+    try:
+        with Image.open(BytesIO(data)) as probe:
+            fmt = probe.format
+            width, height = probe.size
+            probe.verify()
+    except Exception:
+        raise ValueError("File is not a valid image.")
+    if fmt not in FORMATS:
+        raise ValueError("Only JPEG and PNG photos are supported.")
+    if width * height > MAX_PIXELS:
+        raise ValueError(f"Photo is too large ({width}×{height} pixels).")
+    # verify() leaves the image unusable, so decode a fresh copy
+    img = Image.open(BytesIO(data))
+    img.load()
+    return ImageOps.exif_transpose(img), fmt
+
+
+def _thumb_path(photo_dir, digest, size):
+    return Path(photo_dir) / THUMB_DIR / f"{digest}_{size}.png"
+
+
+def _write_thumbnails(img, photo_dir, digest):
+    (Path(photo_dir) / THUMB_DIR).mkdir(parents=True, exist_ok=True)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "P") else "RGB")
+    for size in THUMB_SIZES:
+        path = _thumb_path(photo_dir, digest, size)
+        if path.exists():
+            continue
+        height = max(1, round(img.height * size / img.width))
+        thumb = img.resize((size, height), Image.LANCZOS)
+        tmp = path.with_name(path.name + ".tmp")
+        thumb.save(tmp, format="PNG", optimize=True)
+        os.replace(tmp, path)
+
+
+def save_upload(data, user_id, photo_dir, previous_hash=None):
+    # Validates and stores an uploaded photo plus its thumbnails; returns
+    # (photo path, content hash). Raises ValueError with a user-facing message.
+    img, fmt = _open_image(data)
+    digest = content_hash(data)
+    ext = FORMATS[fmt]
+    photo_path = f"{photo_dir}/{user_id}.{ext}"
+    if max(img.size) > MAX_DIMENSION:
+        stored = img.copy()
+        stored.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+        if fmt == "JPEG" and stored.mode not in ("RGB", "L"):
+            stored = stored.convert("RGB")
+        stored.save(photo_path, format=fmt, **({"quality": 90} if fmt == "JPEG" else {"optimize": True}))
+    else:
+        with open(photo_path, "wb") as f:
+            f.write(data)
+    # An earlier photo with another extension would otherwise linger
+    for other in FORMATS.values():
+        old = Path(f"{photo_dir}/{user_id}.{other}")
+        if other != ext and old.exists():
+            old.unlink()
+    _write_thumbnails(img, photo_dir, digest)
+    if previous_hash and previous_hash != digest:
+        remove_thumbnails(photo_dir, previous_hash)
+    logging.info(f"Saved profile photo for {user_id} ({len(data)} bytes, hash {digest})")
+    return photo_path, digest
+
+
+def remove_thumbnails(photo_dir, digest):
+    for size in THUMB_SIZES:
+        _thumb_path(photo_dir, digest, size).unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=THUMB_CACHE_SIZE)
+def _file_hash(path, mtime_ns, size):
+    # Content hash of a photo stored before uploads were hashed (read once per version of the file)
+    return content_hash(Path(path).read_bytes())
+
+
+@lru_cache(maxsize=THUMB_CACHE_SIZE)
+def _thumbnail_bytes(photo_dir, digest, size, source_path):
+    path = _thumb_path(photo_dir, digest, size)
+    if not path.exists():
+        img, _ = _open_image(Path(source_path).read_bytes())
+        _write_thumbnails(img, photo_dir, digest)
+    return path.read_bytes()
+
+
+def thumbnail(user_obj, size, photo_dir):
+    # PNG bytes of the user's photo at ``size`` px wide, or None if they have no photo
+    photo_path = user_obj.get("photo") if user_obj else None
+    if not photo_path:
+        return None
+    try:
+        digest = user_obj.get("photo_hash")
+        if not digest:
+            stat = os.stat(photo_path)
+            digest = _file_hash(photo_path, stat.st_mtime_ns, stat.st_size)
+        return _thumbnail_bytes(str(photo_dir), digest, size, photo_path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"No thumbnail for photo {photo_path}: {e}")
+        return None
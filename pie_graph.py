@@ -1,40 +1,80 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-from datetime import datetime, date, timedelta
+import matplotlib.dates as mdates
+from datetime import datetime, date, time as dt_time
 import logging
 import json
 import hashlib
 from pathlib import Path
-import psycopg2
 from psycopg2.extras import RealDictCursor 
 from supabase import create_client
 import os
 from dotenv import load_dotenv
 from functools import lru_cache
 import time
+import analytics
+from write_queue import WriteQueue
+from purge_job import PurgeJob
+from db_breaker import CircuitBreaker
+from activity_cube import ActivityCube
+from interval_index import IntervalIndex, entry_span, to_minute
+from date_index import DateIndex
+from result_cache import ResultCache
+from shared_frames import SharedFrames
+from cache_warmer import CacheWarmer
+import search_index
+import photos
+import activity_catalog
+import query_stats
+import csv_lock
+
+# Fragments rerun a single section instead of the whole script (no-op on older Streamlit)
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
 
 load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# Database connection function with caching
+PG_CONN_PARAMS = dict(
+    host="ycqfpozukuwnwzqrhynn.supabase.co",
+    database="postgres",
+    user="postgres",
+    password="RyanWork@Summmer25",
+    port=5432,
+    sslmode="require"
+)
+# DATABASE_URL points the app at another database (e.g. a local Postgres for load tests);
+# DATABASE_URL=none runs without one, on the CSV and the local write queue only
+if os.getenv("DATABASE_URL", "").lower() == "none":
+    PG_CONN_PARAMS = None
+elif os.getenv("DATABASE_URL"):
+    PG_CONN_PARAMS = dict(dsn=os.getenv("DATABASE_URL"))
+
+# Per-statement latency/row stats, exported in Prometheus text format every few seconds
 @st.cache_resource
+def get_query_stats():
+    query_stats.STATS.start()
+    return query_stats.STATS
+
+# Circuit breaker owns the shared connection (bounded timeouts, background health probe)
+@st.cache_resource
+def get_db_breaker():
+    # Every connection times its statements (slow-query log, query_stats.<pid>.prom)
+    get_query_stats()
+    if PG_CONN_PARAMS is None:
+        return CircuitBreaker(None)
+    breaker = CircuitBreaker(dict(PG_CONN_PARAMS, connection_factory=query_stats.TimedConnection))
+    breaker.start_probe()
+    return breaker
+
+# Pooled database connection handle (``with conn as conn`` checks one out per
+# transaction, so concurrent sessions and the cache warmer never share one);
+# None while the database is unreachable, so callers go straight to their local
+# fallback instead of waiting on a dead host
 def get_pg_conn():
-    try:
-        return psycopg2.connect(
-            host="ycqfpozukuwnwzqrhynn.supabase.co",
-            database="postgres",
-            user="postgres",
-            password="RyanWork@Summmer25",
-            port=5432,
-            sslmode="require"
-        )
-    except Exception as e:
-        logging.error(f"Database connection failed: {e}")
-        # Return None to indicate connection failure
-        return None
+    return get_db_breaker().connection()
 
 CSV_FILE = "time_log.csv"
 USERS_FILE = "users.json"
@@ -77,8 +117,8 @@ Path(PROFILE_PHOTO_DIR).mkdir(exist_ok=True)
 # ------------------------
 # Load Data into Session with caching
 # ------------------------
-@st.cache_data(ttl=60)  # Cache for 1 minute
-def load_user_time_log_cached(user_id):
+# Returns (frame, from_db); frames read from the CSV fallback are never published or cached
+def load_user_time_log_from_source(user_id):
     logging.debug(f"Loading time log for user_id={user_id}")
     try:
         conn = get_pg_conn()
@@ -93,25 +133,28 @@ def load_user_time_log_cached(user_id):
                 if user_id:
                     df = df[df["user_id"] == user_id]
                 df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-                return df
+                return df, False
             else:
-                return pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"])
+                return pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"]), False
         
         with conn as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SELECT * FROM time_log WHERE user_id = %s ORDER BY date, time", (user_id,))
+                # Only the columns the app shows; idempotency_key, search_tsv and activity_id stay in the database
+                cur.execute("SELECT id, date, time, what_i_did, user_id FROM time_log WHERE user_id = %s ORDER BY date, time", (user_id,))
                 rows = cur.fetchall()
                 logging.info(f"Loaded {len(rows)} rows for user_id={user_id}")
+                get_db_breaker().record_success()
                 if rows:
                     df = pd.DataFrame(rows)
                     df.rename(columns={"date": "Date", "time": "Time", "what_i_did": "What I Did", "user_id": "user_id"}, inplace=True)
                     df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-                    return df
+                    return df, True
                 else:
                     logging.warning(f"No time log entries found for user_id={user_id}")
-                    return pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"])
+                    return pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"]), True
     except Exception as e:
         logging.error(f"Error loading time log for user_id={user_id}: {e}")
+        get_db_breaker().record_error(e)
         # Fallback to CSV file if any error occurs
         try:
             if Path(CSV_FILE).exists():
@@ -122,19 +165,237 @@ def load_user_time_log_cached(user_id):
                 if user_id:
                     df = df[df["user_id"] == user_id]
                 df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-                return df
+                return df, False
             else:
-                return pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"])
+                return pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"]), False
         except Exception as csv_error:
             logging.error(f"Error loading CSV file: {csv_error}")
-            return pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"])
+            return pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"]), False
+
+# Per-user frames shared by every worker process on the host through memory-mapped files
+@st.cache_resource
+def get_shared_frames():
+    return SharedFrames()
+
+# Maps the frame published for the current data version, or loads and publishes it
+# (``refresh`` republishes unconditionally, used by the cache warmer)
+def load_user_time_log_cached(user_id, refresh=False):
+    shared = get_shared_frames()
+    data_version = get_data_version([user_id])
+    if not refresh:
+        try:
+            df = shared.load(user_id, data_version)
+            if df is not None:
+                return df
+        except Exception as e:
+            logging.error(f"Error mapping shared time log for user_id={user_id}: {e}")
+    df, from_db = load_user_time_log_from_source(user_id)
+    if not from_db:
+        return df
+    try:
+        shared.publish(user_id, data_version, df)
+    except Exception as e:
+        logging.error(f"Error publishing shared time log for user_id={user_id}: {e}")
+    return df
 
 def load_user_time_log(user_id):
     # Use cached version for better performance
-    return load_user_time_log_cached(user_id)
+    df = load_user_time_log_cached(user_id)
+    if not user_id:
+        return df
+    # Entries still waiting in the write queue are shown as if already saved
+    pending = get_write_queue().pending(user_id)
+    if not pending:
+        return df
+    # (their queue_key sends edits and deletes of them to the queue, see queued_key)
+    pending_df = pd.DataFrame(pending).rename(columns={"idempotency_key": "queue_key", "date": "Date", "time": "Time", "what_i_did": "What I Did"})
+    pending_df["Date"] = pd.to_datetime(pending_df["Date"], errors="coerce")
+    return pd.concat([df, pending_df], ignore_index=True)
+
+def load_all_users_data(user_ids):
+    all_dfs = []
+    for user_id in user_ids:
+        df = load_user_time_log(user_id)
+        if not df.empty:
+            all_dfs.append(df)
+    if all_dfs:
+        return pd.concat(all_dfs, ignore_index=True)
+    else:
+        return pd.DataFrame(columns=["Date", "Time", "What I Did", "user_id"])
+
+# ------------------------
+# Dashboard aggregations (GROUP BY in Postgres, pandas over the CSV fallback)
+# ------------------------
+# Returns (result, from_db); results from the CSV fallback must not be cached beyond this request
+def run_dashboard_query(query, user_ids, *args):
+    conn = get_pg_conn()
+    if conn is not None:
+        try:
+            with conn as conn:
+                result = query(conn, user_ids, *args)
+            get_db_breaker().record_success()
+            return result, True
+        except Exception as e:
+            logging.error(f"Error running dashboard query {query.__name__} in database, falling back to pandas: {e}")
+            get_db_breaker().record_error(e)
+    return query(load_all_users_data(user_ids), user_ids, *args), False
+
+# Part of the key of the in-memory dashboard caches, so results built on the CSV
+# fallback are rebuilt from the database as soon as it is reachable again
+def db_online():
+    return get_db_breaker().state == "closed"
+
+# On-disk results keyed by data version; survives restarts and is shared by every process on the host
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
+# Data version of ``user_ids`` (a tuple, one version per user), bumped by every write
+# to their entries; structures built "once per data version" are keyed by it
+def get_data_version(user_ids):
+    return get_result_cache().data_version(user_ids)
+
+# Generation of the warmed caches of ``key`` (a user_id, or a dashboard's user-id tuple).
+# The caches the warmer keeps hot (bounds, cube, interval and date indexes) have no
+# ttl: they are keyed by data version and generation, and the warmer advances the
+# generation once it has built the next one (see cache_warmer)
+def get_cache_generation(key):
+    return get_cache_warmer().generation(key)
+
+@st.cache_data(max_entries=64)
+def load_dashboard_bounds(user_ids, data_version, generation, db_online):
+    return get_result_cache().get_or_compute(
+        "dashboard_bounds", user_ids, None, None,
+        lambda: run_dashboard_query(analytics.date_bounds, user_ids))
+
+# Whether the activity catalog migration (python activity_catalog.py) has run, rechecked every 5 minutes;
+# until then the daily totals group by the activity text, with the same result
+@st.cache_resource(ttl=300)
+def db_catalog_ready():
+    with get_pg_conn() as conn:
+        return activity_catalog.catalog_ready(conn)
+
+# User × day × activity-group cube; every dashboard view for any date range is a slice of it
+@st.cache_resource(max_entries=16)
+def load_activity_cube(user_ids, data_version, generation, db_online):
+    use_catalog = False
+    if get_pg_conn() is not None:
+        try:
+            use_catalog = db_catalog_ready()
+        except Exception as e:
+            logging.error(f"Error checking for the activity catalog: {e}")
+            get_db_breaker().record_error(e)
+    bounds = load_dashboard_bounds(user_ids, data_version, generation, db_online)
+    if bounds is None:
+        return ActivityCube.from_daily(pd.DataFrame(columns=analytics.DAILY_ACTIVITY_COLUMNS))
+    daily = get_result_cache().get_or_compute(
+        "daily_activity_totals", user_ids, *bounds,
+        lambda: run_dashboard_query(analytics.daily_activity_totals, user_ids, *bounds, use_catalog))
+    return ActivityCube.from_daily(daily)
+
+@st.cache_data(ttl=60)  # Cache for 1 minute
+def load_activity_entries(user_ids, start_date, end_date, activities, data_version, db_online):
+    return get_result_cache().get_or_compute(
+        "activity_entries", user_ids, start_date, end_date,
+        lambda: run_dashboard_query(analytics.activity_entries, user_ids, start_date, end_date, activities),
+        *activities)
+
+# Interval index over a user's entries (point lookups, overlap checks, covered minutes)
+# cache_resource hands back the same read-only object instead of unpickling a copy per rerun
+# (keyed like the dashboard caches, see get_cache_generation() and db_online())
+@st.cache_resource(max_entries=64)
+def load_interval_index(user_id, data_version, generation, db_online):
+    df = load_user_time_log(user_id).reset_index(drop=True)
+    return df, IntervalIndex.from_frame(df)
+
+# Per-user day -> row range index with per-day chart breakdowns, rebuilt when the
+# data version (or the user's count of queued, not yet flushed entries, the warmer's
+# generation or db_online) changes
+@st.cache_resource(max_entries=32)
+def load_date_index(user_id, data_version, pending_entries, generation, db_online):
+    return DateIndex.from_frame(load_user_time_log(user_id))
+
+# ------------------------
+# Search (Postgres full-text/trigram index, local inverted index on the CSV fallback)
+# ------------------------
+# Whether the search migration (python search_index.py) has run, rechecked every 5 minutes;
+# until then searches use the local index, which returns the same matches
+@st.cache_resource(ttl=300)
+def db_search_ready():
+    with get_pg_conn() as conn:
+        return search_index.search_schema_ready(conn)
+
+@st.cache_resource(ttl=60)  # Cache for 1 minute
+def load_search_index(user_id, data_version):
+    return search_index.InvertedIndex.from_frame(load_user_time_log(user_id))
+
+def search_user_entries(user_id, query, limit=None, offset=0):
+    conn = get_pg_conn()
+    if conn is not None:
+        try:
+            if db_search_ready():
+                with conn as conn:
+                    result = search_index.search_time_log(conn, user_id, query, limit, offset)
+                get_db_breaker().record_success()
+                return result
+        except Exception as e:
+            logging.error(f"Error searching time log for user_id={user_id}, falling back to local index: {e}")
+            get_db_breaker().record_error(e)
+    return load_search_index(user_id, get_data_version([user_id])).search(query, limit, offset)
+
+# Retire every cached view of ``user_ids``' time logs after a write to them
+def clear_time_log_caches(user_ids):
+    # Every cache of the time log (in memory, shared frames, on-disk results) is
+    # keyed by the data version of the users it covers, so this retires theirs
+    # and leaves other users' caches alone
+    get_result_cache().bump_version(user_ids)
+    # Rebuild active users' caches now instead of in their next request
+    get_cache_warmer().mark_dirty(user_ids)
+
+# Durable local queue behind "Add Entry"; one flusher thread per process
+@st.cache_resource
+def get_write_queue():
+    queue = WriteQueue(get_db_breaker().new_connection, on_flush=clear_time_log_caches)
+    # Without a database there is nowhere to flush to; entries stay queued and are shown from the queue
+    if PG_CONN_PARAMS is not None:
+        queue.start()
+    return queue
+
+# Deletes removed users' rows (Postgres, CSV, write queue) in batches in the background
+@st.cache_resource
+def get_purge_job():
+    connect = get_db_breaker().new_connection if PG_CONN_PARAMS is not None else None
+    job = PurgeJob(connect, CSV_FILE, write_queue=get_write_queue(), on_done=lambda user_id: clear_time_log_caches([user_id]))
+    job.start()
+    return job
+
+# Refreshes active users' frames, indexes and dashboard cubes ahead of their requests
+WARM_LEAD = 15  # seconds before a shared frame would expire that it is republished
+
+# Builds the entries for the next generation; readers switch to them once all are built
+def warm_user_caches(user_id, dashboards, generations):
+    if get_pg_conn() is None:
+        # Offline everything would come from the CSV fallback, which isn't kept warm
+        return False
+    data_version = get_data_version([user_id])
+    age = get_shared_frames().age(user_id, data_version)
+    if age is None or age > get_shared_frames().max_age - WARM_LEAD:
+        load_user_time_log_cached(user_id, refresh=True)
+    load_interval_index(user_id, data_version, generations[user_id], True)
+    load_date_index(user_id, data_version, get_write_queue().depth(user_id), generations[user_id], True)
+    for dash_user_ids in dashboards:
+        dash_version = get_data_version(dash_user_ids)
+        load_dashboard_bounds(dash_user_ids, dash_version, generations[dash_user_ids], True)
+        load_activity_cube(dash_user_ids, dash_version, generations[dash_user_ids], True)
+
+@st.cache_resource
+def get_cache_warmer():
+    warmer = CacheWarmer(warm_user_caches)
+    warmer.start()
+    return warmer
 
 if "df" not in st.session_state:
-    st.session_state.df = load_user_time_log(None)  # Empty by default
+    st.session_state.df = pd.DataFrame(columns=["id", "Date", "Time", "What I Did", "user_id"])  # Empty by default
 
 # Load users from JSON with caching
 @st.cache_data(ttl=60)  # Cache for 1 minute
@@ -148,6 +409,11 @@ def load_users_cached():
 # Load users from JSON (move this above login)
 users = load_users_cached()
 
+# Background workers start with the first request of the process, so queued
+# entries flush and purges interrupted by a restart resume before anyone logs in
+get_write_queue()
+get_purge_job()
+
 # Function to save users and clear cache
 def save_users(users):
     with open(USERS_FILE, "w") as f:
@@ -201,8 +467,10 @@ if not st.session_state.logged_in:
                                     (reg_user, first_name, last_name, reg_email)
                                 )
                                 conn.commit()
+                        get_db_breaker().record_success()
                     except Exception as e:
                         logging.error(f"Failed to add user to info table: {e}")
+                        get_db_breaker().record_error(e)
                     logging.info(f"Registered new user: {reg_user}")
                     st.success(f"User '{reg_user}' registered! You can now log in.")
                     st.stop()
@@ -257,8 +525,10 @@ if not users:
                             (reg_user, first_name, last_name, reg_email)
                         )
                         conn.commit()
+                get_db_breaker().record_success()
             except Exception as e:
                 logging.error(f"Failed to add user to info table: {e}")
+                get_db_breaker().record_error(e)
             st.success(f"User '{reg_user}' registered as admin! Please restart the app and log in.")
             st.stop()
         else:
@@ -271,8 +541,9 @@ if st.session_state.logged_in:
     st.markdown("---")
     st.markdown(f"### 👤 Logged in as: **{user_obj['full_name']}**  ")
     st.markdown(f"**Username:** `{user_obj['id']}`")
-    if user_obj.get("photo") and Path(user_obj["photo"]).exists():
-        st.image(user_obj["photo"], width=100, caption="Profile Photo")
+    header_thumb = photos.thumbnail(user_obj, 100, PROFILE_PHOTO_DIR)
+    if header_thumb:
+        st.image(header_thumb, width=100, caption="Profile Photo")
     st.markdown("---")
     # Make admin/superadmin flags available everywhere
     is_admin = user_obj and user_obj.get("role") == "admin"
@@ -285,33 +556,15 @@ else:
 def reload_user_df():
     st.session_state.df = load_user_time_log(current_user)
 
-if st.session_state.logged_in:
-    reload_user_df()
-    user_df = st.session_state.df.copy()
-else:
-    user_df = pd.DataFrame(columns=["Date", "Time", "What I Did", "user_id"])
+# The log as last loaded for this session; only pages that declare "user_log"
+# load it (see PAGES), and write paths refresh it with reload_user_df()
+def get_user_df():
+    return st.session_state.df.copy()
 
 # ------------------------
-# 📑 Sidebar Navigation (Pages)
+# Pages
 # ------------------------
-page = st.sidebar.radio(
-    "Go to page:",
-    [
-        "Add Entry",
-        "Edit Time Log",
-        "View Charts",
-        "Dashboard",  # <-- Added Dashboard page
-        "User Management",  # <-- Added User Management to navigation
-        "Profile Photo",
-        "Kick Out Users"
-    ],
-    index=0
-)
-
-# ------------------------
-# Main Page Routing
-# ------------------------
-if page == "Add Entry":
+def page_add_entry():
     # ------------------------
     # ➕ Add Entry
     # ------------------------
@@ -322,99 +575,102 @@ if page == "Add Entry":
         form_task = st.text_input("What I Did")
         submitted = st.form_submit_button("Add Entry")
 
-    # ➕ Add Entry (write to PostgreSQL or CSV as fallback)
+    # ➕ Add Entry (queued locally, flushed to PostgreSQL in the background)
     def add_time_log_entry(date, time, what_i_did, user_id):
-        conn = get_pg_conn()
-        if conn is None:
-            # Fallback to CSV file if database connection fails
-            logging.warning("Database connection failed, saving to CSV file")
-            try:
-                # Read existing data
-                if Path(CSV_FILE).exists():
-                    df = pd.read_csv(CSV_FILE)
-                else:
-                    df = pd.DataFrame(columns=["id", "date", "time", "what_i_did", "user_id"])
-            
-                # Ensure 'id' column exists
-                if "id" not in df.columns:
-                    df["id"] = range(1, len(df) + 1)
-            
-                # Generate new ID (max ID + 1 or 1 if empty)
-                new_id = df["id"].max() + 1 if not df.empty else 1
-            
-                # Add new entry
-                new_row = pd.DataFrame([{
-                    "id": new_id,
-                    "date": date,
-                    "time": time,
-                    "what_i_did": what_i_did,
-                    "user_id": user_id
-                }])
-            
-                df = pd.concat([df, new_row], ignore_index=True)
-                df.to_csv(CSV_FILE, index=False)
-                # Clear cache to force reload
-                load_user_time_log_cached.clear()
-                logging.info(f"Entry saved to CSV: Date={date}, Time={time}, Task={what_i_did}")
-            except Exception as e:
-                logging.error(f"Error saving to CSV: {e}")
-                raise
-        else:
-            with conn as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "INSERT INTO time_log (date, time, what_i_did, user_id) VALUES (%s, %s, %s, %s)",
-                        (date, time, what_i_did, user_id)
-                    )
-                    conn.commit()
-                    # Clear cache to force reload
-                    load_user_time_log_cached.clear()
+        key = get_write_queue().enqueue(date, time, what_i_did, user_id)
+        logging.debug(f"DEBUG: Queued entry {key} for user {user_id}")
+        # Offline, queued entries only reach the dashboards through the pandas
+        # fallback, and no flush will invalidate the cached results for them
+        if get_db_breaker().status()["state"] != "closed":
+            clear_time_log_caches([user_id])
 
     if submitted:
         if form_time.strip() and form_task.strip():
+            # Check the new range against the user's existing entries before adding
+            span = entry_span(form_date, form_time.strip())
+            overlapping_rows = pd.DataFrame()
+            if span is not None:
+                log_df, log_index = load_interval_index(current_user, get_data_version([current_user]), get_cache_generation(current_user), db_online())
+                overlapping_rows = log_df.loc[log_index.overlapping(*span), ["Date", "Time", "What I Did"]]
             add_time_log_entry(form_date, form_time.strip(), form_task.strip(), current_user)
             st.success("✅ Entry added!")
-            reload_user_df()
+            if not overlapping_rows.empty:
+                st.warning(f"⚠️ This entry overlaps {len(overlapping_rows)} existing entr{'y' if len(overlapping_rows) == 1 else 'ies'}:")
+                st.dataframe(overlapping_rows, hide_index=True)
             logging.info(f"Added entry: User={current_user}, Date={form_date}, Time={form_time.strip()}, Task={form_task.strip()}")
             logging.debug(f"DEBUG: Entry added for user {current_user} on {form_date} at {form_time.strip()} for task '{form_task.strip()}'")
         else:
             st.error("⚠️ Please enter both time and activity.")
             logging.warning("Attempted to add entry with missing time or activity.")
-elif page == "Edit Time Log":
+
+def page_edit_time_log():
     # ------------------------
     # 📝 Edit Time Log with Editable Table, Delete Button, and Recent Entry Highlight
     # ------------------------
     st.subheader("📝 Edit Time Log")
+    edit_time_log_section()
+
+# Queue key of a displayed row that is still waiting in the write queue, else None.
+# Such rows are edited and deleted in the queue; changing only Postgres or the CSV
+# would match nothing, and the later flush would bring the old version back.
+def queued_key(display_df, idx):
+    if "queue_key" not in display_df.columns or idx not in display_df.index:
+        return None
+    key = display_df.at[idx, "queue_key"]
+    return key if isinstance(key, str) else None
+
+def entry_changed(row, orig_row):
+    return (
+        str(row["Date"]) != str(orig_row["Date"]) or
+        row["Time"] != orig_row["Time"] or
+        row["What I Did"] != orig_row["What I Did"]
+    )
+
+# Search box, pagination and editor rerun on their own, not the whole script
+@fragment
+def edit_time_log_section():
+    user_df = get_user_df()
     if not user_df.empty:
         # --- Search box ---
         search_query = st.text_input("🔍 Search your entries (by activity or time)", "")
-        user_df_display = user_df.reset_index(drop=True)
-        # Filter by search
-        if search_query.strip():
-            mask = (
-                user_df_display["What I Did"].str.contains(search_query, case=False, na=False) |
-                user_df_display["Time"].astype(str).str.contains(search_query, case=False, na=False)
-            )
-            user_df_display = user_df_display[mask].reset_index(drop=True)
-        # Sort by Date and Time descending to show recent entries first
-        user_df_display = user_df_display.sort_values(by=["Date", "Time"], ascending=[False, False]).reset_index(drop=True)
+        page_size = 50
+        # Back to the first page whenever the search changes
+        if st.session_state.get("edit_search") != search_query:
+            st.session_state.edit_search = search_query
+            st.session_state.edit_page = 1
+        page_number = st.session_state.get("edit_page", 1)
+        searching = bool(search_query.strip())
+        if searching:
+            # Ranked matches, best first (prefix matching on every word, or a substring);
+            # only the current page is fetched
+            total_rows, user_df_display = search_user_entries(current_user, search_query, page_size, (page_number - 1) * page_size)
+            if user_df_display.empty and total_rows and page_number > 1:
+                # Fewer matches than before (e.g. after deleting some): start over
+                page_number = 1
+                total_rows, user_df_display = search_user_entries(current_user, search_query, page_size, 0)
+            user_df_display = user_df_display.reset_index(drop=True)
+        else:
+            # Sort by Date and Time descending to show recent entries first
+            user_df_display = user_df.sort_values(by=["Date", "Time"], ascending=[False, False]).reset_index(drop=True)
+            total_rows = len(user_df_display)
         
         # Add pagination for better performance with large datasets
-        page_size = 50
-        total_rows = len(user_df_display)
-        total_pages = (total_rows - 1) // page_size + 1
+        total_pages = max(1, (total_rows - 1) // page_size + 1)
+        page_number = min(page_number, total_pages)
         
         if total_pages > 1:
-            page_number = st.number_input("Page", min_value=1, max_value=total_pages, value=1)
+            st.session_state.edit_page = page_number
+            page_number = st.number_input("Page", min_value=1, max_value=total_pages, key="edit_page")
             start_idx = (page_number - 1) * page_size
             end_idx = min(start_idx + page_size, total_rows)
-            user_df_display = user_df_display.iloc[start_idx:end_idx]
+            if not searching:
+                user_df_display = user_df_display.iloc[start_idx:end_idx]
             st.write(f"Showing {start_idx+1}-{end_idx} of {total_rows} entries")
         
         # Add a Delete? checkbox column
         user_df_display["Delete?"] = False
         edited_df = st.data_editor(
-            user_df_display.drop(columns=["user_id"]),
+            user_df_display.drop(columns=["user_id", "queue_key"], errors="ignore"),
             num_rows="dynamic",
             use_container_width=True,
             key="edit_time_log_table",
@@ -425,28 +681,44 @@ elif page == "Edit Time Log":
         if st.button("🗑️ Delete Selected"):
             to_delete = edited_df[edited_df["Delete?"] == True]
             if not to_delete.empty:
+                # Entries still waiting in the write queue are deleted there
+                dequeued = []
+                for idx in to_delete.index:
+                    key = queued_key(user_df_display, idx)
+                    if key and get_write_queue().remove(key):
+                        dequeued.append(idx)
+                if dequeued:
+                    to_delete = to_delete.drop(index=dequeued)
+                    clear_time_log_caches([current_user])
+                    logging.info(f"Deleted {len(dequeued)} queued entries for user {current_user}")
+                    if to_delete.empty:
+                        st.success(f"Deleted {len(dequeued)} entries.")
+                        reload_user_df()
+                        st.rerun()
                 conn = get_pg_conn()
                 if conn is None:
                     # Fallback to CSV file if database connection fails
                     logging.warning("Database connection failed, deleting from CSV file")
                     try:
                         if Path(CSV_FILE).exists():
-                            df = pd.read_csv(CSV_FILE)
-                            # Ensure 'id' column exists
-                            if "id" not in df.columns:
-                                df["id"] = range(1, len(df) + 1)
-                            # Delete matching rows
-                            for _, row in to_delete.iterrows():
-                                mask = (
-                                    (df["date"] == str(row["Date"])) &
-                                    (df["time"] == row["Time"]) &
-                                    (df["what_i_did"] == row["What I Did"]) &
-                                    (df["user_id"] == current_user)
-                                )
-                                df = df[~mask]
-                            df.to_csv(CSV_FILE, index=False)
+                            # Same lock as the background purge, which also rewrites the CSV
+                            with csv_lock.locked(CSV_FILE):
+                                df = pd.read_csv(CSV_FILE)
+                                # Ensure 'id' column exists
+                                if "id" not in df.columns:
+                                    df["id"] = range(1, len(df) + 1)
+                                # Delete matching rows
+                                for _, row in to_delete.iterrows():
+                                    mask = (
+                                        (df["date"] == str(row["Date"])) &
+                                        (df["time"] == row["Time"]) &
+                                        (df["what_i_did"] == row["What I Did"]) &
+                                        (df["user_id"] == current_user)
+                                    )
+                                    df = df[~mask]
+                                csv_lock.write_atomic(df, CSV_FILE)
                             # Clear cache to force reload
-                            load_user_time_log_cached.clear()
+                            clear_time_log_caches([current_user])
                             st.success(f"Deleted {len(to_delete)} entries from CSV.")
                             reload_user_df()
                             st.rerun()
@@ -457,47 +729,70 @@ elif page == "Edit Time Log":
                         st.error(f"Error deleting from CSV: {e}")
                         logging.error(f"Error deleting from CSV: {e}")
                 else:
-                    with conn as conn:
-                        with conn.cursor() as cur:
-                            cur.execute(
-                                "DELETE FROM time_log WHERE date = %s AND time = %s AND what_i_did = %s AND user_id = %s",
-                                (row["Date"], row["Time"], row["What I Did"], current_user)
-                            )
-                        conn.commit()
+                    try:
+                        with conn as conn:
+                            with conn.cursor() as cur:
+                                for _, row in to_delete.iterrows():
+                                    cur.execute(
+                                        "DELETE FROM time_log WHERE date = %s AND time = %s AND what_i_did = %s AND user_id = %s",
+                                        (row["Date"], row["Time"], row["What I Did"], current_user)
+                                    )
+                            conn.commit()
+                        get_db_breaker().record_success()
+                    except Exception as e:
+                        st.error(f"Error deleting entries: {e}")
+                        logging.error(f"Error deleting entries for user {current_user}: {e}")
+                        get_db_breaker().record_error(e)
+                    else:
                         # Clear cache to force reload
-                        load_user_time_log_cached.clear()
-                    st.success(f"Deleted {len(to_delete)} entries.")
-                    reload_user_df()
-                    st.rerun()
-                    logging.info(f"Deleted {len(to_delete)} entries for user {current_user}")
+                        clear_time_log_caches([current_user])
+                        st.success(f"Deleted {len(to_delete) + len(dequeued)} entries.")
+                        reload_user_df()
+                        logging.info(f"Deleted {len(to_delete)} entries for user {current_user}")
+                        st.rerun()
             else:
                 st.info("No rows selected for deletion.")
                 logging.debug("DEBUG: No rows selected for deletion.")
         # Save edits to PostgreSQL
         if st.button("💾 Save All Edits"):
+            # Edits of entries still waiting in the write queue are made in the queue
+            requeued = []
+            for idx, row in edited_df.iterrows():
+                key = queued_key(user_df_display, idx)
+                if key and entry_changed(row, user_df_display.loc[idx]):
+                    if get_write_queue().update(key, pd.to_datetime(row["Date"]).date(), row["Time"], row["What I Did"]):
+                        requeued.append(idx)
+            if requeued:
+                edited_df = edited_df.drop(index=requeued)
+                clear_time_log_caches([current_user])
+                logging.info(f"Saved edits of {len(requeued)} queued entries for user {current_user}")
             conn = get_pg_conn()
             if conn is None:
                 # Fallback to CSV file if database connection fails
                 logging.warning("Database connection failed, saving edits to CSV file")
                 try:
                     if Path(CSV_FILE).exists():
-                        df = pd.read_csv(CSV_FILE)
-                        # Ensure 'id' column exists
-                        if "id" not in df.columns:
-                            df["id"] = range(1, len(df) + 1)
-                        # Update matching rows
-                        for idx, row in edited_df.iterrows():
-                            orig_row = user_df_display.iloc[idx]
-                            # Find the corresponding row in the CSV
-                            mask = (
-                                (df["date"] == str(orig_row["Date"])) &
-                                (df["time"] == orig_row["Time"]) &
-                                (df["what_i_did"] == orig_row["What I Did"]) &
-                                (df["user_id"] == current_user)
-                            )
-                            # Update the matching row
-                            df.loc[mask, ["date", "time", "what_i_did"]] = [str(row["Date"]), row["Time"], row["What I Did"]]
-                        df.to_csv(CSV_FILE, index=False)
+                        # Same lock as the background purge, which also rewrites the CSV
+                        with csv_lock.locked(CSV_FILE):
+                            df = pd.read_csv(CSV_FILE)
+                            # Ensure 'id' column exists
+                            if "id" not in df.columns:
+                                df["id"] = range(1, len(df) + 1)
+                            # Update matching rows
+                            for idx, row in edited_df.iterrows():
+                                if idx not in user_df_display.index:
+                                    continue
+                                orig_row = user_df_display.loc[idx]
+                                # Find the corresponding row in the CSV
+                                mask = (
+                                    (df["date"] == str(orig_row["Date"])) &
+                                    (df["time"] == orig_row["Time"]) &
+                                    (df["what_i_did"] == orig_row["What I Did"]) &
+                                    (df["user_id"] == current_user)
+                                )
+                                # Update the matching row
+                                df.loc[mask, ["date", "time", "what_i_did"]] = [str(row["Date"]), row["Time"], row["What I Did"]]
+                            csv_lock.write_atomic(df, CSV_FILE)
                         st.success("All edits saved to CSV!")
                         reload_user_df()
                         logging.info(f"All edits saved for user {current_user} to CSV")
@@ -507,28 +802,34 @@ elif page == "Edit Time Log":
                     st.error(f"Error saving edits to CSV: {e}")
                     logging.error(f"Error saving edits to CSV: {e}")
             else:
-                for idx, row in edited_df.iterrows():
-                    orig_row = user_df_display.iloc[idx]
-                    if (
-                        str(row["Date"]) != str(orig_row["Date"]) or
-                        row["Time"] != orig_row["Time"] or
-                        row["What I Did"] != orig_row["What I Did"]
-                    ):
-                        with conn as conn:
-                            with conn.cursor() as cur:
-                                cur.execute(
-                                    "UPDATE time_log SET date = %s, time = %s, what_i_did = %s WHERE date = %s AND time = %s AND what_i_did = %s AND user_id = %s",
-                                    (row["Date"], row["Time"], row["What I Did"], orig_row["Date"], orig_row["Time"], orig_row["What I Did"], current_user)
-                                )
-                            conn.commit()
-                # Clear cache to force reload
-                load_user_time_log_cached.clear()
-                st.success("All edits saved!")
+                try:
+                    for idx, row in edited_df.iterrows():
+                        if idx not in user_df_display.index:
+                            continue
+                        orig_row = user_df_display.loc[idx]
+                        if entry_changed(row, orig_row):
+                            with conn as conn:
+                                with conn.cursor() as cur:
+                                    cur.execute(
+                                        "UPDATE time_log SET date = %s, time = %s, what_i_did = %s WHERE date = %s AND time = %s AND what_i_did = %s AND user_id = %s",
+                                        (row["Date"], row["Time"], row["What I Did"], orig_row["Date"], orig_row["Time"], orig_row["What I Did"], current_user)
+                                    )
+                                conn.commit()
+                    get_db_breaker().record_success()
+                except Exception as e:
+                    st.error(f"Error saving edits: {e}")
+                    logging.error(f"Error saving edits for user {current_user}: {e}")
+                    get_db_breaker().record_error(e)
+                else:
+                    st.success("All edits saved!")
+                    logging.info(f"All edits saved for user {current_user}")
+                # Clear cache to force reload (edits committed before a failure included)
+                clear_time_log_caches([current_user])
                 reload_user_df()
-                logging.info(f"All edits saved for user {current_user}")
     else:
         st.info("No entries to display.")
-elif page == "View Charts":
+
+def page_view_charts():
     # ------------------------
     # 📊 Pie Chart Viewer (Admin can see all, user can only see their own)
     # ------------------------
@@ -540,79 +841,39 @@ elif page == "View Charts":
     else:
         # Regular user: can only see their own
         selected_user_id = current_user
-    selected_user_df = load_user_time_log(selected_user_id)
-    valid_dates = pd.to_datetime(selected_user_df["Date"], errors="coerce").dropna().dt.date.unique()
-    if len(valid_dates) == 0:
+    view_charts_section(selected_user_id)
+
+# Picking another date or lookup time reruns only the chart section
+@fragment
+def view_charts_section(selected_user_id):
+    date_index = load_date_index(selected_user_id, get_data_version([selected_user_id]), get_write_queue().depth(selected_user_id), get_cache_generation(selected_user_id), db_online())
+    if not len(date_index):
         st.info("No data available to chart for this user.")
     else:
-        selected_date = st.date_input("📅 Pick a date", value=max(valid_dates),
-                                      min_value=min(valid_dates), max_value=max(valid_dates), key="chart_date_"+selected_user_id)
-        day_df = selected_user_df[
-            pd.to_datetime(selected_user_df["Date"], errors="coerce").dt.date == selected_date
-        ]
-        def time_to_minutes(t, what_i_did):
-            try:
-                # Handle empty or None values
-                if not t or pd.isna(t):
-                    return 0
-                
-                t_lower = str(t).lower().strip()
-                # Use actual time range for all sleep-related activities
-                sleep_keywords = ["sleep", "slept", "sleeping", "i was sleeping", "nap", "bed", "rest"]
-                is_sleep = any(kw in t_lower for kw in sleep_keywords)
-                
-                # Handle single time values (like "7:30" without range)
-                if "-" not in t:
-                    # For single time values, default to 5 minutes (or 540 for sleep)
-                    return 540 if is_sleep else 5
-                
-                # Process time ranges
-                start, end = str(t).split("-", 1)  # Split only on first dash
-                start = start.strip()
-                end = end.strip()
-                
-                # Handle cases like "5:30 -7:31" with inconsistent spacing
-                s = datetime.strptime(start, "%H:%M")
-                e = datetime.strptime(end, "%H:%M")
-                
-                # Handle overnight (end < start)
-                if e <= s:
-                    e = e + timedelta(days=1)
-                
-                duration = int((e - s).total_seconds() / 60)
-                
-                # Validate duration ranges
-                if duration <= 0:
-                    return 0
-                if is_sleep:
-                    if duration > 960:  # More than 16 hours of sleep is unrealistic
-                        return 0
-                else:
-                    if duration > 720:  # More than 12 hours for other activities is unrealistic
-                        return 0
-                return duration
-            except Exception as e:
-                # Log the error for debugging
-                logging.warning(f"Error parsing time '{t}': {e}")
-                # Return default values based on activity type
-                sleep_keywords = ["sleep", "slept", "sleeping", "i was sleeping", "nap", "bed", "rest"]
-                is_sleep = any(kw in str(what_i_did).lower() for kw in sleep_keywords) if what_i_did else False
-                return 540 if is_sleep else 5
-        day_df = day_df.copy()
-        day_df["Duration"] = day_df.apply(lambda row: time_to_minutes(row["Time"], row["What I Did"]), axis=1)
-        day_df = day_df[day_df["Duration"] > 0]
-        day_df["Label"] = day_df["What I Did"] + " (" + day_df["Time"] + ")"
-        summary = day_df.groupby("Label")["Duration"].sum()
+        selected_date = st.date_input("📅 Pick a date", value=date_index.last_day,
+                                      min_value=date_index.first_day, max_value=date_index.last_day, key="chart_date_"+selected_user_id)
+        summary, covered_minutes = date_index.breakdown(selected_date)
         if summary.empty:
             st.warning("⚠️ No valid time entries for selected date.")
         else:
             st.subheader(f"⏱ Time Breakdown for {selected_user_id} on {selected_date}")
+            st.caption(f"Covered minutes: {covered_minutes} (overlapping entries counted once)")
             fig, ax = plt.subplots(figsize=(8, 6))
             ax.pie(summary, labels=summary.index, autopct="%1.1f%%", startangle=140)
             ax.axis("equal")
             st.pyplot(fig)
             logging.info(f"Displayed pie chart for {selected_date} with {len(summary)} segments.")
-elif page == "User Management":
+        # Point-in-time lookup (includes entries that started the previous evening)
+        lookup_time = st.time_input("🔎 What was I doing at", value=dt_time(12, 0), key="chart_lookup_"+selected_user_id)
+        if lookup_time is not None:
+            log_df, log_index = load_interval_index(selected_user_id, get_data_version([selected_user_id]), get_cache_generation(selected_user_id), db_online())
+            hits = log_index.at(to_minute(selected_date, lookup_time.hour * 60 + lookup_time.minute))
+            if hits:
+                st.dataframe(log_df.loc[hits, ["Date", "Time", "What I Did"]], hide_index=True)
+            else:
+                st.info(f"Nothing logged at {lookup_time.strftime('%H:%M')} on {selected_date}.")
+
+def page_user_management():
     # ------------------------
     # 👤 User Management
     # ------------------------
@@ -690,9 +951,9 @@ elif page == "User Management":
             my_username = st.text_input("Username", value=user_obj["id"], key="my_username", disabled=True)
             my_new_pass = st.text_input("New Password", type="password", key="my_new_pass")
             my_confirm_pass = st.text_input("Confirm New Password", type="password", key="my_confirm_pass")
-            photo_path = user_obj.get("photo")
-            if photo_path and Path(photo_path).exists():
-                st.image(photo_path, width=150, caption="Current Profile Photo")
+            current_thumb = photos.thumbnail(user_obj, 150, PROFILE_PHOTO_DIR)
+            if current_thumb:
+                st.image(current_thumb, width=150, caption="Current Profile Photo")
             uploaded_photo = st.file_uploader("Upload a new profile photo (jpg/png)", type=["jpg", "jpeg", "png"], key="my_profile_photo_upload")
             if st.button("Save My Profile"):
                 user_obj["full_name"] = my_name
@@ -706,15 +967,18 @@ elif page == "User Management":
                         st.error("Passwords do not match.")
                         st.stop()
                 if uploaded_photo:
-                    ext = uploaded_photo.name.split('.')[-1]
-                    save_path = f"{PROFILE_PHOTO_DIR}/{user_obj['id']}.{ext}"
-                    with open(save_path, "wb") as f:
-                        f.write(uploaded_photo.read())
-                    user_obj["photo"] = save_path
+                    try:
+                        user_obj["photo"], user_obj["photo_hash"] = photos.save_upload(
+                            uploaded_photo.getvalue(), user_obj["id"], PROFILE_PHOTO_DIR, user_obj.get("photo_hash"))
+                    except ValueError as e:
+                        st.error(f"⚠️ {e}")
+                        logging.warning(f"Rejected profile photo upload for {user_obj['id']}: {e}")
+                        st.stop()
                 with open(USERS_FILE, "w") as f:
                     json.dump(users, f, indent=2)
                 st.success("Profile updated!")
-elif page == "Kick Out Users":
+
+def page_kick_out_users():
     # ------------------------
     # 🛑 Remove (Kick Out) Users
     # ------------------------
@@ -726,43 +990,59 @@ elif page == "Kick Out Users":
             user_to_kick = st.selectbox("Select user to remove", user_ids, key="kick_user_select")
             if st.button("Kick Out User"):
                 # Remove user from users.json
-                users = [u for u in users if u["id"] != user_to_kick]
+                kicked_photo_hash = next((u.get("photo_hash") for u in users if u["id"] == user_to_kick), None)
+                users[:] = [u for u in users if u["id"] != user_to_kick]
                 with open(USERS_FILE, "w") as f:
                     json.dump(users, f, indent=2)
-                # Remove their entries from the time log
+                # Remove their entries from the time log (database and CSV rows are purged in the background)
                 st.session_state.df = st.session_state.df[st.session_state.df["user_id"] != user_to_kick]
+                get_purge_job().submit(user_to_kick)
+                logging.info(f"Queued data purge for removed user: {user_to_kick}")
                 # Optionally, remove their profile photo
                 import os
                 for ext in ["jpg", "jpeg", "png"]:
                     photo_path = f"{PROFILE_PHOTO_DIR}/{user_to_kick}.{ext}"
                     if os.path.exists(photo_path):
                         os.remove(photo_path)
+                if kicked_photo_hash:
+                    photos.remove_thumbnails(PROFILE_PHOTO_DIR, kicked_photo_hash)
                 st.success(f"User '{user_to_kick}' has been removed from the system (including their data and photo).")
         else:
             st.info("No users available to remove.")
+        # Progress of background purges
+        purge_jobs = get_purge_job().jobs()
+        if purge_jobs:
+            st.markdown("**Data purges**")
+            purge_df = pd.DataFrame(purge_jobs)[["user_id", "status", "time_log_deleted", "csv_deleted", "info_deleted", "requested_at", "finished_at", "last_error"]]
+            st.dataframe(purge_df, hide_index=True)
     else:
         st.warning("Only admins can kick out users.")
-elif page == "Profile Photo":
+
+def page_profile_photo():
     # ------------------------
     # 🖼️ Profile Photo (Anyone can add or change their own profile photo)
     # ------------------------
     st.subheader("🖼️ Profile Photo")
     user_obj = next((u for u in users if u["id"] == current_user), None)
-    photo_path = user_obj.get("photo") if user_obj else None
-    if photo_path and Path(photo_path).exists():
-        st.image(photo_path, width=150, caption="Current Profile Photo")
+    current_thumb = photos.thumbnail(user_obj, 150, PROFILE_PHOTO_DIR)
+    if current_thumb:
+        st.image(current_thumb, width=150, caption="Current Profile Photo")
     uploaded_photo = st.file_uploader("Upload a new profile photo (jpg/png)", type=["jpg", "jpeg", "png"], key="profile_photo_upload")
-    if uploaded_photo and user_obj:
-        ext = uploaded_photo.name.split('.')[-1]
-        save_path = f"{PROFILE_PHOTO_DIR}/{current_user}.{ext}"
-        with open(save_path, "wb") as f:
-            f.write(uploaded_photo.read())
-        user_obj["photo"] = save_path
-        with open(USERS_FILE, "w") as f:
-            json.dump(users, f, indent=2)
-        st.success("Profile photo updated!")
-        st.image(save_path, width=150, caption="New Profile Photo")
-elif page == "Dashboard":
+    # The uploader keeps its file across reruns; only a new image is processed and saved
+    if uploaded_photo and user_obj and photos.content_hash(uploaded_photo.getvalue()) != user_obj.get("photo_hash"):
+        try:
+            user_obj["photo"], user_obj["photo_hash"] = photos.save_upload(
+                uploaded_photo.getvalue(), current_user, PROFILE_PHOTO_DIR, user_obj.get("photo_hash"))
+        except ValueError as e:
+            st.error(f"⚠️ {e}")
+            logging.warning(f"Rejected profile photo upload for {current_user}: {e}")
+        else:
+            with open(USERS_FILE, "w") as f:
+                json.dump(users, f, indent=2)
+            st.success("Profile photo updated!")
+            st.image(photos.thumbnail(user_obj, 150, PROFILE_PHOTO_DIR), width=150, caption="New Profile Photo")
+
+def page_dashboard():
     # ------------------------
     # 📈 Dashboard: Detailed Analytics Over Date Range
     # ------------------------
@@ -773,279 +1053,225 @@ elif page == "Dashboard":
     else:
         selected_user_id = current_user
     if selected_user_id == "All Users":
-        # Aggregate all users' data with caching
-        @st.cache_data(ttl=60)  # Cache for 1 minute
-        def load_all_users_data(_users):
-            all_dfs = []
-            for u in _users:
-                df = load_user_time_log(u["id"])
-                if not df.empty:
-                    all_dfs.append(df)
-            if all_dfs:
-                return pd.concat(all_dfs, ignore_index=True)
-            else:
-                return pd.DataFrame(columns=["Date", "Time", "What I Did", "user_id"])
-        
-        dash_df = load_all_users_data(users)
+        dash_user_ids = tuple(u["id"] for u in users)
     else:
-        dash_df = load_user_time_log(selected_user_id)
-    if dash_df.empty:
+        dash_user_ids = (selected_user_id,)
+    get_cache_warmer().touch(current_user, dash_user_ids)
+    dashboard_section(dash_user_ids, (is_admin or is_super_admin) and selected_user_id == "All Users")
+
+# Line chart on a real date axis; tick count is bounded by the locator, not the number of points
+# Empty buckets are NaN gaps, so every point gets a marker (smaller on long ranges):
+# a bucket with gaps on both sides has no line segment and would otherwise not be drawn
+def trend_figure(trend, ylabel, title, color=None):
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.plot(trend.index, trend.to_numpy(), marker="o", markersize=6 if len(trend) <= 60 else 2, color=color)
+    locator = mdates.AutoDateLocator(maxticks=10)
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    ax.set_xlabel("Date")
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    return fig
+
+# Changing the date range reruns only the analytics below the user selector
+@fragment
+def dashboard_section(dash_user_ids, show_user_breakdown):
+    # Only the date bounds and aggregated rows are fetched, never the full history
+    data_version = get_data_version(dash_user_ids)
+    generation = get_cache_generation(dash_user_ids)
+    bounds = load_dashboard_bounds(dash_user_ids, data_version, generation, db_online())
+    if bounds is None:
         st.info("No data available for dashboard analytics.")
     else:
-        dash_df = dash_df.copy()
-        dash_df["Date"] = pd.to_datetime(dash_df["Date"], errors="coerce")
-        dash_df = dash_df.dropna(subset=["Date"])
-        
-        # Check if we have any valid dates after cleaning
-        if dash_df.empty:
-            st.info("No valid date data available for dashboard analytics.")
+        min_date, max_date = bounds
+        # Ensure min_date is not greater than max_date
+        if min_date > max_date:
+            min_date, max_date = max_date, min_date
+
+        date_range = st.date_input("Select date range", value=(min_date, max_date), min_value=min_date, max_value=max_date, key="dashboard_date_range")
+        if isinstance(date_range, tuple) and len(date_range) == 2:
+            start_date, end_date = date_range
+        else:
+            start_date = end_date = date_range
+        if isinstance(start_date, tuple):
+            start_date = start_date[0]
+        if isinstance(end_date, tuple):
+            end_date = end_date[0]
+        cube = load_activity_cube(dash_user_ids, data_version, generation, db_online())
+        agg = cube.aggregates(dash_user_ids, start_date, end_date)
+        if agg["entries"] == 0:
+            st.warning("No data in selected date range.")
         else:
-            # Get min and max dates, with fallback to today if NaT
-            min_date_series = dash_df["Date"].min()
-            max_date_series = dash_df["Date"].max()
-            
-            # Handle NaT values
-            if pd.isna(min_date_series) or pd.isna(max_date_series):
-                st.info("No valid date data available for dashboard analytics.")
+            st.write(f"**Total Entries:** {agg['entries']}")
+            st.write(f"**Unique Users:** {agg['users']}")
+            # Per-user summary for admins
+            if show_user_breakdown:
+                st.subheader("Per-User Summary Table")
+                user_summary = agg["per_user"].set_index("user_id")[["minutes", "entries"]].rename(columns={"minutes": "Total Minutes", "entries": "Entry Count"})
+                st.dataframe(user_summary)
+            # --- Activity Breakdown Pie Chart ---
+            # (activities are grouped by meaningful shared word when the cube is built;
+            # 'ate' entries are already excluded)
+            activity_summary = agg["groups"].set_index("Activity Group")["minutes"].sort_values(ascending=False)
+            # --- Custom labels for user based on activity totals ---
+            label_message = None
+            sleep_time = activity_summary.get("Sleep", 0)
+            homework_time = activity_summary.get("Homework", 0)
+            eating_time = activity_summary.get("Eating", 0)
+            watch_time = activity_summary.get("Watch", 0)
+            play_time = activity_summary.get("Play", 0)
+            max_activity = activity_summary.idxmax() if not activity_summary.empty else None
+            # Dynamic sleep threshold based on date range
+            num_days = agg["num_days"]
+            if num_days >= 365:
+                sleep_threshold = 36000  # 1 year
+            elif num_days >= 60:
+                sleep_threshold = 6000   # 2 months
+            elif num_days >= 28:
+                sleep_threshold = 3000   # 1 month
             else:
-                min_date = min_date_series.date()
-                max_date = max_date_series.date()
-                
-                # Ensure min_date is not greater than max_date
-                if min_date > max_date:
-                    min_date, max_date = max_date, min_date
-                
-                date_range = st.date_input("Select date range", value=(min_date, max_date), min_value=min_date, max_value=max_date, key="dashboard_date_range")
-                if isinstance(date_range, tuple) and len(date_range) == 2:
-                    start_date, end_date = date_range
-                else:
-                    start_date = end_date = date_range
-                if isinstance(start_date, tuple):
-                    start_date = start_date[0]
-                if isinstance(end_date, tuple):
-                    end_date = end_date[0]
-                mask = (dash_df["Date"].dt.date >= start_date) & (dash_df["Date"].dt.date <= end_date)
-                period_df = dash_df[mask]
-                if period_df.empty:
-                    st.warning("No data in selected date range.")
-                else:
-                    # Ensure Duration column exists before any aggregation
-                    @st.cache_data(ttl=300)  # Cache for 5 minutes
-                    def time_to_minutes_cached(t, what_i_did):
-                        try:
-                            # Handle None or NaN values
-                            if pd.isna(t) or t is None or str(t).strip() == "":
-                                return 0
-                            
-                            t_lower = str(t).lower()
-                            sleep_keywords = ["sleep", "slept", "sleeping", "i was sleeping", "nap", "bed", "rest"]
-                            is_sleep = any(kw in t_lower for kw in sleep_keywords)
-                            if "-" in t:
-                                start, end = str(t).split("-")
-                                s = datetime.strptime(start.strip(), "%H:%M")
-                                e = datetime.strptime(end.strip(), "%H:%M")
-                                # Handle overnight (end < start)
-                                if e <= s:
-                                    e = e + timedelta(days=1)
-                                duration = int((e - s).total_seconds() / 60)
-                                # Accept up to 16 hours (960 min) for sleep, 12 for others
-                                if duration <= 0:
-                                    return 0
-                                if is_sleep:
-                                    if duration > 960:
-                                        return 0
-                                else:
-                                    if duration > 720:
-                                        return 0
-                                return duration
-                            # If no time range, fallback
-                            return 540 if is_sleep else 5
-                        except Exception:
-                            return 0
-            
-                    period_df["Duration"] = period_df.apply(lambda row: time_to_minutes_cached(row["Time"], row["What I Did"]), axis=1)
-                    st.write(f"**Total Entries:** {len(period_df)}")
-                    st.write(f"**Unique Users:** {period_df['user_id'].nunique()}")
-                    # Per-user summary for admins
-                    if (is_admin or is_super_admin) and selected_user_id == "All Users":
-                        st.subheader("Per-User Summary Table")
-                        user_summary = period_df.groupby("user_id").agg({"Duration": "sum", "What I Did": "count"}).rename(columns={"Duration": "Total Minutes", "What I Did": "Entry Count"})
-                        st.dataframe(user_summary)
-                    # --- existing dashboard analytics code below ---
-                    # --- Combine Eating Activities ---here it acts as if i ate from 12 am to 1 am
-                    def is_eating(activity):
-                        eat_keywords = ["eat", "breakfast", "lunch", "dinner", "snack", "food", "meal"]
-                        activity_lower = str(activity).lower()
-                        return any(kw in activity_lower for kw in eat_keywords)
-                    def is_sleep(activity):
-                        sleep_keywords = ["sleep", "nap", "bed", "rest", "slept", "sleeping","I was sleeping"]
-                        activity_lower = str(activity).lower()
-                        return any(kw in activity_lower for kw in sleep_keywords)
-                    # --- Remove 'ate' activity from dashboard analytics ---
-                    period_df = period_df[~period_df["What I Did"].str.strip().str.lower().eq("ate")]
-                    # --- Group similar activities by meaningful shared word ---
-                    import re
-                    # List of common stopwords to ignore in grouping
-                    stopwords = set([
-                        "i", "to", "the", "a", "an", "and", "of", "in", "on", "for", "with", "at", "by", "from", "up", "about", "into", "over", "after", "is", "it", "my", "me", "do", "did", "am", "are", "was", "were", "be", "been", "being", "have", "has", "had", "will", "would", "can", "could", "should", "shall", "may", "might", "must", "that", "this", "these", "those", "as", "but", "if", "or", "because", "so", "just", "not", "no", "yes", "you", "your", "we", "our", "us", "they", "their", "them", "he", "she", "his", "her", "him", "its", "who", "whom", "which", "what", "when", "where", "why", "how"
-                    ])
-                    
-                    @st.cache_data(ttl=300)  # Cache for 5 minutes
-                    def group_activity_meaningful_word(activity, period_df_sample):
-                        activity_lower = str(activity).lower()
-                        # Map any activity containing 'ate' (as a word or substring) to 'Eating'
-                        if 'ate' in activity_lower.split() or 'ate' in activity_lower:
-                            return "Eating"
-                        if is_eating(activity):
-                            return "Eating"
-                        if is_sleep(activity):
-                            return "Sleep"
-                        # Custom grouping: 'track', 'field', 'school' all as 'School'
-                        school_keywords = {"track", "field", "school"}
-                        words = set(w for w in re.findall(r"\w+", activity_lower))
-                        if words & school_keywords:
-                            return "School"
-                        # Custom grouping: 'home' as 'Homework'
-                        if "home" in words:
-                            return "Homework"
-                        # Tokenize and filter out stopwords
-                        words = set(w for w in re.findall(r"\w+", activity_lower) if w not in stopwords)
-                        if not words:
-                            words = set(re.findall(r"\w+", activity_lower))
-                        # For performance, only check against a sample of activities
-                        sample_activities = period_df_sample.head(50)["What I Did"].unique() if len(period_df_sample) > 50 else period_df_sample["What I Did"].unique()
-                        for other in sample_activities:
-                            other_lower = str(other).lower()
-                            if other == activity:
-                                continue
-                            other_words = set(w for w in re.findall(r"\w+", other_lower) if w not in stopwords)
-                            if words & other_words:
-                                return sorted(words & other_words)[0].capitalize()
-                        if words:
-                            # Prevent 'Ate' as a group label
-                            first_word = sorted(words)[0].capitalize()
-                            if first_word == "Ate":
-                                return "Eating"
-                            return first_word
-                        return activity.strip().capitalize()
-                    
-                    # Apply grouping with a sample of the dataframe for performance
-                    period_df_sample = period_df.sample(n=min(100, len(period_df))) if len(period_df) > 100 else period_df
-                    period_df["Activity Group"] = period_df["What I Did"].apply(lambda x: group_activity_meaningful_word(x, period_df_sample))
-                    # --- Activity Breakdown Pie Chart ---
-                    activity_summary = period_df.groupby("Activity Group")["Duration"].sum().sort_values(ascending=False)
-                    # --- Custom labels for user based on activity totals ---
-                    label_message = None
-                    sleep_time = activity_summary.get("Sleep", 0)
-                    homework_time = activity_summary.get("Homework", 0)
-                    eating_time = activity_summary.get("Eating", 0)
-                    watch_time = activity_summary.get("Watch", 0)
-                    play_time = activity_summary.get("Play", 0)
-                    max_activity = activity_summary.idxmax() if not activity_summary.empty else None
-                    # Dynamic sleep threshold based on date range
-                    num_days = len(period_df["Date"].dt.date.unique())
-                    if num_days >= 365:
-                        sleep_threshold = 36000  # 1 year
-                    elif num_days >= 60:
-                        sleep_threshold = 6000   # 2 months
-                    elif num_days >= 28:
-                        sleep_threshold = 3000   # 1 month
-                    else:
-                        sleep_threshold = 1000   # fallback for short ranges
-                    # --- END: Dynamic sleep threshold ---
-                    if homework_time >= max(watch_time, play_time):
-                        label_message = "businessman! (Homework more than Play or Watch)"
-                    elif (watch_time is not None and watch_time == activity_summary.max()) or (play_time is not None and play_time == activity_summary.max()):
-                        label_message = "🚽 Toilet Cleaner! (Watched/Played more than anything)"
-                    elif eating_time > sleep_time:
-                        label_message = "🤪 Idiot! (Ate more than slept)"
-                    if label_message:
-                        st.subheader("Summary of Who You Are")
-                        st.info(label_message)
-                    if not activity_summary.empty:
-                        st.subheader("Activity Breakdown")
-                        fig1, ax1 = plt.subplots(figsize=(7, 5))
-                        ax1.pie(activity_summary, labels=activity_summary.index, autopct="%1.1f%%", startangle=140)
-                        ax1.axis("equal")
-                        st.pyplot(fig1)
-                    # --- Average time spent on key activities ---
-                    key_activities = ["Sleep", "Eating", "Watch", "Homework", "Play"]
-                    num_days = len(period_df["Date"].dt.date.unique())
-                    st.subheader("Average Time Spent Per Day (Key Activities)")
-                    avg_data = {}
-                    for act in key_activities:
-                        total = activity_summary.get(act, 0)
-                        avg = total / num_days if num_days > 0 else 0
-                        avg_data[act] = avg
-                    avg_df = pd.DataFrame(list(avg_data.items()), columns=["Activity", "Average Minutes"])
-                    st.table(avg_df.set_index("Activity"))
-                    # --- Additional Dashboards ---
-                    import seaborn as sns
-                    import numpy as np
-                    # 1. Bar chart: Total minutes per user (if admin and All Users)
-                    if (is_admin or is_super_admin) and selected_user_id == "All Users":
-                        st.subheader("Total Minutes Logged Per User")
-                        user_minutes = period_df.groupby("user_id")["Duration"].sum().sort_values(ascending=False)
-                        fig2, ax2 = plt.subplots(figsize=(8, 4))
-                        sns.barplot(x=user_minutes.index, y=user_minutes.values, ax=ax2)
-                        ax2.set_ylabel("Total Minutes")
-                        ax2.set_xlabel("User ID")
-                        st.pyplot(fig2)
-                    # 2. Bar chart: Top 10 activities (all or per user)
-                    st.subheader("Top 10 Activities by Time Spent")
-                    top_acts = period_df.groupby("Activity Group")["Duration"].sum().sort_values(ascending=False).head(10)
-                    fig3, ax3 = plt.subplots(figsize=(8, 4))
-                    sns.barplot(x=top_acts.values, y=top_acts.index, ax=ax3, orient="h")
-                    ax3.set_xlabel("Total Minutes")
-                    ax3.set_ylabel("Activity Group")
-                    st.pyplot(fig3)
-                    # 3. Line chart: Time trend (total minutes per day)
-                    st.subheader("Time Trend: Total Minutes Per Day")
-                    trend_df = period_df.groupby(period_df["Date"].dt.date)["Duration"].sum().reset_index()
-                    # Remove daily cap (no clip)
-                    # Format dates for neat x-axis labels
-                    trend_df["DateStr"] = pd.to_datetime(trend_df["Date"]).dt.strftime("%b %d, %Y")
-                    fig4, ax4 = plt.subplots(figsize=(8, 4))
-                    ax4.plot(trend_df["DateStr"], trend_df["Duration"], marker="o")
-                    ax4.set_xlabel("Date")
-                    ax4.set_ylabel("Total Minutes")
-                    ax4.set_title("Total Minutes Logged Per Day")
-                    plt.setp(ax4.get_xticklabels(), rotation=45, ha="right")
-                    st.pyplot(fig4)
-                    # 4. Heatmap: Activity vs. Day of Week
-                    st.subheader("Activity Heatmap (Activity Group vs. Day of Week)")
-                    # Special handling: set 'Bath' to 5 min, 'Eating' to 60 min per day
-                    period_df = period_df.copy()
-                    period_df.loc[period_df["Activity Group"] == "Bath", "Duration"] = 5
-                    period_df.loc[period_df["Activity Group"] == "Eating", "Duration"] = 60
-                    # Remove 'ate' from heatmap as well
-                    period_df = period_df[~period_df["What I Did"].str.strip().str.lower().eq("ate")]
-                    period_df["DayOfWeek"] = period_df["Date"].dt.day_name()
-                    heatmap_df = period_df.pivot_table(index="Activity Group", columns="DayOfWeek", values="Duration", aggfunc="sum", fill_value=0)
-                    # Reorder columns to standard week order
-                    week_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-                    heatmap_df = heatmap_df.reindex(columns=week_order, fill_value=0)
-                    fig5, ax5 = plt.subplots(figsize=(10, 6))
-                    sns.heatmap(heatmap_df, annot=True, fmt=".0f", cmap="YlGnBu", ax=ax5)
-                    ax5.set_xlabel("Day of Week")
-                    ax5.set_ylabel("Activity Group")
-                    st.pyplot(fig5)
-                    # 5. Line chart: Time spent on Python per day
-                    st.subheader("Time Spent on Python Per Day")
-                    python_df = period_df[period_df["Activity Group"] == "Python"]
-                    if not python_df.empty:
-                        python_trend = python_df.groupby(python_df["Date"].dt.date)["Duration"].sum().reset_index()
-                        python_trend["DateStr"] = pd.to_datetime(python_trend["Date"]).dt.strftime("%b %d, %Y")
-                        fig_py, ax_py = plt.subplots(figsize=(8, 4))
-                        ax_py.plot(python_trend["DateStr"], python_trend["Duration"], marker="o", color="orange")
-                        ax_py.set_xlabel("Date")
-                        ax_py.set_ylabel("Minutes Spent on Python")
-                        ax_py.set_title("Time Spent on Python Per Day")
-                        plt.setp(ax_py.get_xticklabels(), rotation=45, ha="right")
-                        st.pyplot(fig_py)
-                    else:
-                        st.info("No Python activity found in selected date range.")
-                    # Show table of all Python entries
-                    if not python_df.empty:
-                        st.subheader("Python Activity Log Entries")
-                        st.dataframe(python_df[["Date", "Time", "What I Did", "Duration"]].sort_values(by=["Date", "Time"]))
+                sleep_threshold = 1000   # fallback for short ranges
+            # --- END: Dynamic sleep threshold ---
+            if homework_time >= max(watch_time, play_time):
+                label_message = "businessman! (Homework more than Play or Watch)"
+            elif (watch_time is not None and watch_time == activity_summary.max()) or (play_time is not None and play_time == activity_summary.max()):
+                label_message = "🚽 Toilet Cleaner! (Watched/Played more than anything)"
+            elif eating_time > sleep_time:
+                label_message = "🤪 Idiot! (Ate more than slept)"
+            if label_message:
+                st.subheader("Summary of Who You Are")
+                st.info(label_message)
+            if not activity_summary.empty:
+                st.subheader("Activity Breakdown")
+                fig1, ax1 = plt.subplots(figsize=(7, 5))
+                ax1.pie(activity_summary, labels=activity_summary.index, autopct="%1.1f%%", startangle=140)
+                ax1.axis("equal")
+                st.pyplot(fig1)
+            # --- Average time spent on key activities ---
+            key_activities = ["Sleep", "Eating", "Watch", "Homework", "Play"]
+            st.subheader("Average Time Spent Per Day (Key Activities)")
+            avg_data = {}
+            for act in key_activities:
+                total = activity_summary.get(act, 0)
+                avg = total / num_days if num_days > 0 else 0
+                avg_data[act] = avg
+            avg_df = pd.DataFrame(list(avg_data.items()), columns=["Activity", "Average Minutes"])
+            st.table(avg_df.set_index("Activity"))
+            # --- Additional Dashboards ---
+            import seaborn as sns
+            import numpy as np
+            # 1. Bar chart: Total minutes per user (if admin and All Users)
+            if show_user_breakdown:
+                st.subheader("Total Minutes Logged Per User")
+                user_minutes = agg["per_user"].set_index("user_id")["active_minutes"].sort_values(ascending=False)
+                fig2, ax2 = plt.subplots(figsize=(8, 4))
+                sns.barplot(x=user_minutes.index, y=user_minutes.values, ax=ax2)
+                ax2.set_ylabel("Total Minutes")
+                ax2.set_xlabel("User ID")
+                st.pyplot(fig2)
+            # 2. Bar chart: Top 10 activities (all or per user)
+            st.subheader("Top 10 Activities by Time Spent")
+            top_acts = activity_summary.head(10)
+            fig3, ax3 = plt.subplots(figsize=(8, 4))
+            sns.barplot(x=top_acts.values, y=top_acts.index, ax=ax3, orient="h")
+            ax3.set_xlabel("Total Minutes")
+            ax3.set_ylabel("Activity Group")
+            st.pyplot(fig3)
+            # 3. Line chart: Time trend (total minutes per day, week or month depending on the range)
+            trend, resolution = analytics.resample_trend(agg["daily"], start_date, end_date)
+            st.subheader(f"Time Trend: Total Minutes Per {resolution}")
+            fig4 = trend_figure(trend, "Total Minutes", f"Total Minutes Logged Per {resolution}")
+            st.pyplot(fig4)
+            # 4. Heatmap: Activity vs. Day of Week
+            st.subheader("Activity Heatmap (Activity Group vs. Day of Week)")
+            week_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+            weekday_df = agg["weekday"].copy()
+            # Special handling: set 'Bath' to 5 min, 'Eating' to 60 min per entry
+            bath = weekday_df["Activity Group"] == "Bath"
+            eating = weekday_df["Activity Group"] == "Eating"
+            weekday_df.loc[bath, "minutes"] = weekday_df.loc[bath, "entries"] * 5
+            weekday_df.loc[eating, "minutes"] = weekday_df.loc[eating, "entries"] * 60
+            weekday_df["DayOfWeek"] = weekday_df["dow"].map(dict(enumerate(week_order)))
+            heatmap_df = weekday_df.pivot_table(index="Activity Group", columns="DayOfWeek", values="minutes", aggfunc="sum", fill_value=0)
+            # Reorder columns to standard week order
+            heatmap_df = heatmap_df.reindex(columns=week_order, fill_value=0)
+            fig5, ax5 = plt.subplots(figsize=(10, 6))
+            sns.heatmap(heatmap_df, annot=True, fmt=".0f", cmap="YlGnBu", ax=ax5)
+            ax5.set_xlabel("Day of Week")
+            ax5.set_ylabel("Activity Group")
+            st.pyplot(fig5)
+            # 5. Line chart: Time spent on Python per day (or week/month)
+            python_trend = cube.group_daily(dash_user_ids, start_date, end_date, "Python")
+            python_series, resolution = analytics.resample_trend(python_trend, start_date, end_date)
+            st.subheader(f"Time Spent on Python Per {resolution}")
+            if not python_trend.empty:
+                fig_py = trend_figure(python_series, "Minutes Spent on Python", f"Time Spent on Python Per {resolution}", color="orange")
+                st.pyplot(fig_py)
+            else:
+                st.info("No Python activity found in selected date range.")
+            # Show table of all Python entries
+            python_df = load_activity_entries(dash_user_ids, start_date, end_date, cube.activities_in_group("Python"), data_version, db_online()) if not python_trend.empty else pd.DataFrame()
+            if not python_df.empty:
+                st.subheader("Python Activity Log Entries")
+                st.dataframe(python_df)
+
+
+# ------------------------
+# 📑 Sidebar Navigation (Pages)
+# ------------------------
+# Each page declares the data it needs up front; everything else is loaded
+# lazily by the page itself, so pages like "Profile Photo" never touch the log.
+DATA_LOADERS = {
+    "user_log": reload_user_df,
+}
+
+PAGES = {
+    "Add Entry": {"render": page_add_entry, "data": []},
+    "Edit Time Log": {"render": page_edit_time_log, "data": ["user_log"]},
+    "View Charts": {"render": page_view_charts, "data": []},
+    "Dashboard": {"render": page_dashboard, "data": []},
+    "User Management": {"render": page_user_management, "data": []},
+    "Profile Photo": {"render": page_profile_photo, "data": []},
+    "Kick Out Users": {"render": page_kick_out_users, "data": []},
+}
+
+page = st.sidebar.radio(
+    "Go to page:",
+    list(PAGES),
+    index=0
+)
+
+# Database circuit state (reads use the CSV fallback and writes stay queued while open)
+db_status = get_db_breaker().status()
+if db_status["state"] == "disabled":
+    st.sidebar.info("No database configured, working offline.")
+elif db_status["state"] != "closed":
+    st.sidebar.warning(f"⚠️ Database unreachable for {db_status['open_for_seconds']:.0f}s, working offline.")
+
+# Write queue depth (entries added but not yet saved to the database)
+queue_status = get_write_queue().status()
+if queue_status["depth"]:
+    st.sidebar.caption(f"⏳ {queue_status['depth']} entries waiting to sync")
+    if is_admin and queue_status["last_error"]:
+        st.sidebar.caption(f"Last sync error: {queue_status['last_error']} (retrying in {queue_status['backoff_seconds']:.0f}s)")
+
+# Cache warmer (admins only)
+if is_admin:
+    warmer_status = get_cache_warmer().status()
+    with st.sidebar.expander(f"🔥 Cache warmer: {warmer_status['active_users']} active, {warmer_status['warming']} warming"):
+        st.caption(f"{warmer_status['runs']} refreshes, {warmer_status['failures']} failed" + (f" (last error: {warmer_status['last_error']})" if warmer_status["last_error"] else ""))
+        if warmer_status["users"]:
+            st.dataframe(pd.DataFrame(warmer_status["users"]), hide_index=True)
+
+# Slow statements since start (details in the slow-query log)
+if is_admin and get_query_stats().slow_count:
+    st.sidebar.caption(f"🐢 {get_query_stats().slow_count} slow queries (> {query_stats.SLOW_QUERY_MS:.0f}ms), see {query_stats.SLOW_QUERY_LOG}")
+
+
+# ------------------------
+# Main Page Routing
+# ------------------------
+get_cache_warmer().touch(current_user)
+for need in PAGES[page]["data"]:
+    DATA_LOADERS[need]()
+PAGES[page]["render"]()
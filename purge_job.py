@@ -0,0 +1,221 @@
+# ------------------------
+# 🧹 Background purge of removed users' data
+# ------------------------
+# "Kick Out User" only records a purge request (a row in a local SQLite file)
+# and returns.  A background thread then deletes the user's time_log rows in
+# Postgres in bounded batches, each its own short transaction, so a heavy user
+# never holds long locks or stalls other sessions.  Their info row, queued
+# entries and CSV rows go too; queued entries become tombstones, so a batch the
+# flusher had already picked up and commits after our delete is deleted again
+# by its next flush.  Progress is written after every batch; a job
+# interrupted by a restart or an outage is picked up again and simply keeps
+# deleting (every step is idempotent).  ``on_done(user_id)`` runs once a user
+# is fully purged so cached frames and rollups can be invalidated.
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import csv_lock
+
+PURGE_FILE = "purge_jobs.db"
+BATCH_SIZE = 1000
+BATCH_PAUSE = 0.05  # seconds between batches, leaves room for other sessions' queries
+CSV_CHUNK_ROWS = 50000
+IDLE_INTERVAL = 5.0  # seconds between checks for new jobs
+MAX_BACKOFF = 60.0  # seconds
+
+PENDING = "pending"
+DONE = "done"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS purge_jobs (
+    user_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    queue_done INTEGER NOT NULL DEFAULT 0,
+    csv_done INTEGER NOT NULL DEFAULT 0,
+    csv_deleted INTEGER NOT NULL DEFAULT 0,
+    time_log_deleted INTEGER NOT NULL DEFAULT 0,
+    info_deleted INTEGER NOT NULL DEFAULT 0,
+    requested_at TEXT NOT NULL,
+    finished_at TEXT,
+    last_error TEXT
+)
+"""
+
+# Deletes at most one batch; the sub-select keeps each statement (and its locks) small
+_DELETE_BATCH_SQL = """
+    DELETE FROM time_log WHERE id IN (
+        SELECT id FROM time_log WHERE user_id = %s LIMIT %s
+    )
+"""
+
+
+class PurgeJob:
+    def __init__(self, connect, csv_file, write_queue=None, path=PURGE_FILE, on_done=None):
+        # ``connect`` returns a new psycopg2 connection (or raises), or is None
+        # when no database is configured and only local data is purged;
+        # ``write_queue`` (optional) has its not-yet-flushed rows for the user deleted
+        self.connect = connect
+        self.csv_file = csv_file
+        self.write_queue = write_queue
+        self.path = path
+        self.on_done = on_done
+        self.backoff = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        with self._sqlite() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+
+    @contextmanager
+    def _sqlite(self):
+        # One short-lived connection per call; commits on success and always closes
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # ------------------------
+    # Request side (Streamlit request threads)
+    # ------------------------
+    def submit(self, user_id):
+        # Records (or restarts) a purge for ``user_id`` and wakes the worker
+        with self._sqlite() as db:
+            db.execute(
+                """INSERT INTO purge_jobs (user_id, status, requested_at) VALUES (?, ?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET status = excluded.status, queue_done = 0,
+                   csv_done = 0, requested_at = excluded.requested_at, finished_at = NULL, last_error = NULL""",
+                (user_id, PENDING, datetime.now().isoformat())
+            )
+        self._wake.set()
+
+    def jobs(self):
+        # All purge jobs as dicts, newest request first
+        with self._sqlite() as db:
+            db.row_factory = sqlite3.Row
+            rows = db.execute("SELECT * FROM purge_jobs ORDER BY requested_at DESC").fetchall()
+        return [dict(r) for r in rows]
+
+    def status(self):
+        jobs = self.jobs()
+        return {
+            "pending": [j["user_id"] for j in jobs if j["status"] != DONE],
+            "backoff_seconds": self.backoff,
+            "running": bool(self._thread and self._thread.is_alive()),
+        }
+
+    # ------------------------
+    # Worker side (purge thread)
+    # ------------------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="purge-job", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = IDLE_INTERVAL
+            for job in self.jobs():
+                if job["status"] == DONE or self._stop.is_set():
+                    continue
+                try:
+                    self.purge(job)
+                    self.backoff = 0.0
+                except Exception as e:
+                    self._update(job["user_id"], last_error=str(e))
+                    self.backoff = min(MAX_BACKOFF, max(1.0, self.backoff * 2))
+                    wait = self.backoff
+                    logging.warning(f"Purge of user {job['user_id']} failed, retrying in {wait:.0f}s: {e}")
+                    break
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _update(self, user_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._sqlite() as db:
+            db.execute(f"UPDATE purge_jobs SET {assignments} WHERE user_id = ?", (*fields.values(), user_id))
+
+    def _add(self, user_id, column, count):
+        with self._sqlite() as db:
+            db.execute(f"UPDATE purge_jobs SET {column} = {column} + ? WHERE user_id = ?", (count, user_id))
+
+    def purge(self, job):
+        # Runs every remaining step for one job; raises to be retried later
+        user_id = job["user_id"]
+        started = time.perf_counter()
+        if not job["queue_done"]:
+            if self.write_queue is not None:
+                self.write_queue.discard(user_id)
+            self._update(user_id, queue_done=1)
+        if not job["csv_done"]:
+            self._purge_csv(user_id)
+            self._update(user_id, csv_done=1)
+        if self.connect is not None:
+            self._purge_postgres(user_id)
+        self._update(user_id, status=DONE, finished_at=datetime.now().isoformat(), last_error=None)
+        logging.info(f"Purged data of removed user {user_id} in {time.perf_counter() - started:.1f}s")
+        if self.on_done:
+            try:
+                self.on_done(user_id)
+            except Exception as e:
+                logging.error(f"Purge on_done callback failed: {e}")
+
+    def _purge_csv(self, user_id):
+        # Streams the CSV chunk by chunk into a temp file without the user's rows,
+        # then swaps it in atomically; holds the CSV lock so the app's offline
+        # edits neither interleave with nor get overwritten by the swap
+        path = Path(self.csv_file)
+        with csv_lock.locked(path):
+            if not path.exists():
+                return
+            tmp = path.with_name(path.name + ".purge")
+            removed = 0
+            header = True
+            for chunk in pd.read_csv(path, chunksize=CSV_CHUNK_ROWS):
+                if "user_id" not in chunk.columns:
+                    break
+                keep = chunk["user_id"] != user_id
+                removed += int((~keep).sum())
+                chunk[keep].to_csv(tmp, mode="w" if header else "a", header=header, index=False)
+                header = False
+            if not removed:
+                tmp.unlink(missing_ok=True)
+                return
+            os.replace(tmp, path)
+        self._add(user_id, "csv_deleted", removed)
+
+    def _purge_postgres(self, user_id):
+        conn = self.connect()
+        try:
+            while not self._stop.is_set():
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(_DELETE_BATCH_SQL, (user_id, BATCH_SIZE))
+                        deleted = cur.rowcount
+                self._add(user_id, "time_log_deleted", deleted)
+                if deleted < BATCH_SIZE:
+                    break
+                time.sleep(BATCH_PAUSE)
+            else:
+                raise RuntimeError("purge stopped before finishing")
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM info WHERE user_id = %s", (user_id,))
+                    self._add(user_id, "info_deleted", cur.rowcount)
+        finally:
+            conn.close()
@@ -0,0 +1,297 @@
+# ------------------------
+# 🐢 Slow-query log and per-statement query statistics
+# ------------------------
+# Connections created with ``connection_factory=TimedConnection`` hand out
+# cursors (plain or RealDictCursor alike) whose execute() records latency,
+# row count and a statement fingerprint (literals and VALUES lists stripped,
+# so the same query with different values aggregates together).  Statements
+# slower than SLOW_QUERY_MS get their plan captured with a plain EXPLAIN (the
+# statement is not run again) and are written to a JSON-lines slow-query log.
+# The log holds the fingerprint and the plan with its string literals masked,
+# never the statement itself, so the entries users typed (an execute_values
+# INSERT carries a whole batch of them) don't end up in it.
+# Aggregates are exported in Prometheus text format for a node_exporter
+# textfile collector (or a human) to read.  Every worker process writes its
+# own file, query_stats.<pid>.prom, and labels its series with pid="<pid>", so
+# processes never overwrite each other's numbers; files left behind by
+# processes that are gone are removed when the export starts.
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from psycopg2 import extensions
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "slow_queries.log")
+STATS_FILE = os.getenv("QUERY_STATS_FILE", "query_stats.prom")  # per process: query_stats.<pid>.prom
+EXPORT_INTERVAL = 15.0  # seconds between Prometheus file exports
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+MAX_STATEMENT_CHARS = 2000
+
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+# ------------------------
+# Fingerprints
+# ------------------------
+def fingerprint(query):
+    # Statement text with literals replaced by ?, so one fingerprint covers every call
+    text = query.decode(errors="replace") if isinstance(query, bytes) else str(query)
+    text = re.sub(r"--[^\n]*", " ", text)
+    text = re.sub(r"'(?:[^']|'')*'", "?", text)
+    text = re.sub(r"%\(\w+\)s|%s", "?", text)
+    text = re.sub(r"\b\d+(?:\.\d+)?\b", "?", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    # execute_values: "VALUES (?, ?), (?, ?), ..." -> "VALUES (...)"
+    text = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*", "(...)", text)
+    return text
+
+
+def query_id(fp):
+    return hashlib.sha1(fp.encode()).hexdigest()[:12]
+
+
+def mask_literals(plan):
+    # EXPLAIN output quotes the values it filters on ('%text%'::text); keep only their type
+    return re.sub(r"'(?:[^']|'')*'", "?", plan) if plan else plan
+
+
+def _process_file(stats_file, pid):
+    # query_stats.prom -> query_stats.<pid>.prom
+    root, ext = os.path.splitext(stats_file)
+    return f"{root}.{pid}{ext}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+# ------------------------
+# Aggregates
+# ------------------------
+class QueryStats:
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log=SLOW_QUERY_LOG, stats_file=STATS_FILE):
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self.stats_file = stats_file
+        self.pid = os.getpid()
+        self.slow_count = 0
+        self._stats = {}  # query id -> aggregate dict
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, query, seconds, rows, error=None):
+        fp = fingerprint(query)
+        qid = query_id(fp)
+        with self._lock:
+            s = self._stats.get(qid)
+            if s is None:
+                s = self._stats[qid] = {
+                    "fingerprint": fp[:MAX_STATEMENT_CHARS], "calls": 0, "errors": 0, "rows": 0,
+                    "seconds": 0.0, "max_seconds": 0.0, "slow": 0, "buckets": [0] * len(BUCKETS),
+                }
+            s["calls"] += 1
+            s["seconds"] += seconds
+            s["max_seconds"] = max(s["max_seconds"], seconds)
+            s["rows"] += max(rows or 0, 0)
+            if error is not None:
+                s["errors"] += 1
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    s["buckets"][i] += 1
+        return qid, fp
+
+    def record_slow(self, qid, fp, query, seconds, rows, plan):
+        with self._lock:
+            self._stats[qid]["slow"] += 1
+            self.slow_count += 1
+        logging.warning(f"Slow query {qid} took {seconds * 1000:.0f}ms ({rows} rows): {fp[:200]}")
+        entry = {
+            "at": datetime.now().isoformat(),
+            "query_id": qid,
+            "ms": round(seconds * 1000, 1),
+            "rows": rows,
+            "fingerprint": fp[:MAX_STATEMENT_CHARS],
+            "plan": mask_literals(plan),
+        }
+        try:
+            with open(self.slow_log, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logging.error(f"Could not write slow query log: {e}")
+
+    def snapshot(self):
+        # {query id: aggregate} copy, slowest total time first
+        with self._lock:
+            stats = {qid: dict(s, buckets=list(s["buckets"])) for qid, s in self._stats.items()}
+        return dict(sorted(stats.items(), key=lambda item: -item[1]["seconds"]))
+
+    # ------------------------
+    # Prometheus export
+    # ------------------------
+    def prometheus_text(self):
+        def label(value):
+            return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", " ")
+
+        stats = self.snapshot()
+        pid = f'pid="{self.pid}"'
+        lines = [
+            "# HELP daily_tracker_db_query_info Statement fingerprint for each query_id.",
+            "# TYPE daily_tracker_db_query_info gauge",
+        ]
+        for qid, s in stats.items():
+            lines.append(f'daily_tracker_db_query_info{{{pid},query_id="{qid}",statement="{label(s["fingerprint"][:300])}"}} 1')
+        lines += [
+            "# HELP daily_tracker_db_query_duration_seconds Query latency.",
+            "# TYPE daily_tracker_db_query_duration_seconds histogram",
+        ]
+        for qid, s in stats.items():
+            for bound, count in zip(BUCKETS, s["buckets"]):
+                lines.append(f'daily_tracker_db_query_duration_seconds_bucket{{{pid},query_id="{qid}",le="{bound}"}} {count}')
+            lines.append(f'daily_tracker_db_query_duration_seconds_bucket{{{pid},query_id="{qid}",le="+Inf"}} {s["calls"]}')
+            lines.append(f'daily_tracker_db_query_duration_seconds_sum{{{pid},query_id="{qid}"}} {s["seconds"]:.6f}')
+            lines.append(f'daily_tracker_db_query_duration_seconds_count{{{pid},query_id="{qid}"}} {s["calls"]}')
+        for name, key, help_text in [
+            ("rows_total", "rows", "Rows returned or affected."),
+            ("errors_total", "errors", "Statements that raised."),
+            ("slow_total", "slow", f"Statements slower than {self.slow_ms:.0f}ms."),
+        ]:
+            lines.append(f"# HELP daily_tracker_db_query_{name} {help_text}")
+            lines.append(f"# TYPE daily_tracker_db_query_{name} counter")
+            for qid, s in stats.items():
+                lines.append(f'daily_tracker_db_query_{name}{{{pid},query_id="{qid}"}} {s[key]}')
+        return "\n".join(lines) + "\n"
+
+    @property
+    def process_file(self):
+        return _process_file(self.stats_file, self.pid)
+
+    def export(self):
+        # Written to a temp file and renamed, so scrapers never read half a file
+        tmp = f"{self.process_file}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, self.process_file)
+
+    def remove_stale_exports(self):
+        # Files of processes that exited without removing theirs (crash, kill -9)
+        root, ext = os.path.splitext(self.stats_file)
+        for path in glob.glob(f"{glob.escape(root)}.*{ext}"):
+            pid = path[len(root) + 1:len(path) - len(ext)]
+            if pid.isdigit() and int(pid) != self.pid and not _pid_alive(int(pid)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        # A forked worker inherits the parent's STATS; it exports under its own pid
+        self.pid = os.getpid()
+        self.remove_stale_exports()
+        self._thread = threading.Thread(target=self._run, name="query-stats-export", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        try:
+            os.remove(self.process_file)
+        except OSError:
+            pass
+
+    def _run(self):
+        while not self._stop.wait(EXPORT_INTERVAL):
+            try:
+                self.export()
+            except Exception as e:
+                logging.error(f"Query stats export failed: {e}")
+
+
+STATS = QueryStats()
+
+
+# ------------------------
+# psycopg2 integration
+# ------------------------
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        error = None
+        try:
+            return super().execute(query, vars)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            qid, fp = STATS.record(query, seconds, self.rowcount, error)
+            if error is None and seconds * 1000 >= STATS.slow_ms:
+                STATS.record_slow(qid, fp, query, seconds, self.rowcount, self._explain(query, vars))
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        error = None
+        try:
+            return super().executemany(query, vars_list)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            STATS.record(query, time.perf_counter() - started, self.rowcount, error)
+
+    def _explain(self, query, vars):
+        # Plan of a slow statement (EXPLAIN without ANALYZE does not run it again)
+        text = query.decode(errors="replace") if isinstance(query, bytes) else str(query)
+        if not text.lstrip().lower().startswith(_EXPLAINABLE):
+            return None
+        conn = self.connection
+        if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_INERROR:
+            return None
+        # A savepoint keeps a failing EXPLAIN from aborting the caller's transaction
+        savepoint = not conn.autocommit
+        try:
+            with extensions.cursor(conn) as cur:
+                if savepoint:
+                    cur.execute("SAVEPOINT query_stats_explain")
+                try:
+                    cur.execute(b"EXPLAIN " + (query if isinstance(query, bytes) else query.encode()), vars)
+                    return "\n".join(row[0] for row in cur.fetchall())
+                finally:
+                    if savepoint:
+                        if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_INERROR:
+                            cur.execute("ROLLBACK TO SAVEPOINT query_stats_explain")
+                        cur.execute("RELEASE SAVEPOINT query_stats_explain")
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
+
+
+_timed_classes = {}
+
+
+def _timed(cursor_class):
+    # Timed subclass of any cursor class (cursor, RealDictCursor, ...), created once
+    if cursor_class not in _timed_classes:
+        _timed_classes[cursor_class] = type(f"Timed{cursor_class.__name__}", (_TimedCursorMixin, cursor_class), {})
+    return _timed_classes[cursor_class]
+
+
+class TimedConnection(extensions.connection):
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get("cursor_factory") or self.cursor_factory or extensions.cursor
+        kwargs["cursor_factory"] = _timed(cursor_class)
+        return super().cursor(*args, **kwargs)
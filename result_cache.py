@@ -0,0 +1,170 @@
+# ------------------------
+# 💾 Persistent analytics result cache
+# ------------------------
+# Query results (dashboard bounds, daily activity totals, ...) are pickled
+# into a local SQLite file keyed by (query kind, users, date range, data
+# version), so a restarted process starts warm instead of recomputing the
+# "All Users" dashboard from scratch.  Data versions are per user and live in
+# the same file, so all processes on the host see the same ones: a write bumps
+# only its own users' versions, and a result covering several users (the "All
+# Users" dashboard) is keyed by the tuple of their versions, so one user's
+# write leaves every other user's results reachable.  Results of older
+# versions are never read again and age out of the file by LRU eviction.
+# Invalidation relies on the versions; MAX_AGE (RESULT_CACHE_MAX_AGE_HOURS)
+# is only a backstop for changes made outside the app.  A hit doesn't write
+# to the file: its access time is refreshed at most every TOUCH_INTERVAL.
+# Results computed on the CSV fallback are never stored.
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+
+CACHE_FILE = "result_cache.db"
+MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024
+MAX_AGE = float(os.getenv("RESULT_CACHE_MAX_AGE_HOURS", "24")) * 3600  # seconds
+TOUCH_INTERVAL = 60.0  # seconds; how stale a result's last_access may get before a hit updates it
+SCHEMA_VERSION = 3  # PRAGMA user_version; older tables are dropped (it's only a cache)
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS results (
+        key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        stored_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS results_last_access_idx ON results (last_access)",
+    "CREATE TABLE IF NOT EXISTS versions (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+]
+
+
+def result_key(kind, user_ids, start_date, end_date, data_version, *extra):
+    # Stable across processes (unlike hash()); user order doesn't matter
+    parts = [kind, sorted(str(u) for u in user_ids), str(start_date), str(end_date), data_version, [str(e) for e in extra]]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path=CACHE_FILE, max_bytes=MAX_BYTES, max_age=MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        with self._sqlite() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            if db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS results")
+                db.execute("DROP TABLE IF EXISTS meta")
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            for stmt in _SCHEMA:
+                db.execute(stmt)
+
+    @contextmanager
+    def _sqlite(self):
+        # One short-lived connection per call; commits on success and always closes
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # ------------------------
+    # Data version
+    # ------------------------
+    def data_version(self, user_ids):
+        # Tuple of the users' versions, in sorted user order (0 for users never written)
+        user_ids = sorted({str(u) for u in user_ids})
+        with self._sqlite() as db:
+            versions = dict(db.execute(
+                f"SELECT user_id, version FROM versions WHERE user_id IN ({', '.join('?' * len(user_ids))})",
+                user_ids
+            ).fetchall())
+        return tuple(versions.get(u, 0) for u in user_ids)
+
+    def bump_version(self, user_ids):
+        # Called from every write path with the users whose entries changed
+        with self._sqlite() as db:
+            db.executemany(
+                "INSERT INTO versions (user_id, version) VALUES (?, 1) ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+                [(str(u),) for u in set(user_ids)]
+            )
+
+    # ------------------------
+    # Results
+    # ------------------------
+    def get(self, key):
+        # (True, value) on a hit, (False, None) on a miss or an expired result
+        now = time.time()
+        with self._sqlite() as db:
+            row = db.execute("SELECT payload, last_access FROM results WHERE key = ? AND stored_at >= ?", (key, now - self.max_age)).fetchone()
+            # Enough for LRU order without a write on every hit
+            if row is not None and row[1] < now - TOUCH_INTERVAL:
+                db.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+        if row is None:
+            self.misses += 1
+            return False, None
+        try:
+            value = pickle.loads(row[0])
+        except Exception as e:
+            # Written by an incompatible version of the code; treat as a miss
+            logging.warning(f"Dropping unreadable cached result {key[:12]}: {e}")
+            with self._sqlite() as db:
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, value
+
+    def put(self, key, kind, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._sqlite() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO results (key, kind, payload, size, stored_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, payload, len(payload), now, now)
+            )
+            self._evict(db)
+
+    def _evict(self, db):
+        # Drops expired results, then the least recently used ones until the file's results fit in max_bytes
+        db.execute("DELETE FROM results WHERE stored_at < ?", (time.time() - self.max_age,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in db.execute("SELECT key, size FROM results ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        db.executemany("DELETE FROM results WHERE key = ?", doomed)
+        logging.info(f"Result cache evicted {len(doomed)} least recently used results")
+
+    def get_or_compute(self, kind, user_ids, start_date, end_date, compute, *extra):
+        # Looks up the result for the users' current data versions, computing it on a miss.
+        # ``compute`` returns (value, cacheable); values computed on the CSV
+        # fallback pass cacheable=False and are returned without being stored
+        version = self.data_version(user_ids)
+        key = result_key(kind, user_ids, start_date, end_date, version, *extra)
+        found, value = self.get(key)
+        if found:
+            return value
+        value, cacheable = compute()
+        # Only store it if no write landed while computing
+        if cacheable and self.data_version(user_ids) == version:
+            self.put(key, kind, value)
+        return value
+
+    def status(self):
+        with self._sqlite() as db:
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,228 @@
+# ------------------------
+# 🔍 Search over a user's time log
+# ------------------------
+# In Postgres, entries are matched with a GIN-indexed tsvector (prefix matches
+# on every word of the query) plus trigram-indexed ILIKE for substrings such as
+# "7:3" or "ay", and ranked by ts_rank.  On the CSV fallback an in-memory
+# inverted index answers the same queries: token -> row positions for the
+# prefix part and trigram -> row positions for the substring part (like
+# pg_trgm), so a query only touches the rows its postings point at, never the
+# whole history.  Both return the matching rows best match first, and only the
+# requested page, so the Edit page can paginate them directly.
+#
+# The Postgres schema is created by a migration, not by the app (the column
+# is generated, which rewrites time_log, and the indexes are built
+# concurrently, so neither fits in a request or its statement timeout):
+#   DATABASE_URL=postgresql://... python search_index.py
+# Until it has run, the app searches with the local index.
+import re
+import numpy as np
+import pandas as pd
+from bisect import bisect_left
+from psycopg2.extras import RealDictCursor
+
+RESULT_COLUMNS = ["id", "Date", "Time", "What I Did", "user_id"]
+
+# CONCURRENTLY needs autocommit; an interrupted build leaves an INVALID index
+# that IF NOT EXISTS then skips, so drop it before re-running
+SEARCH_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """ALTER TABLE time_log ADD COLUMN IF NOT EXISTS search_tsv tsvector
+       GENERATED ALWAYS AS (to_tsvector('simple', coalesce(what_i_did, '') || ' ' || coalesce(time, ''))) STORED""",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS time_log_search_tsv_idx ON time_log USING GIN (search_tsv)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS time_log_what_i_did_trgm_idx ON time_log USING GIN (what_i_did gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS time_log_time_trgm_idx ON time_log USING GIN (time gin_trgm_ops)",
+]
+
+_SEARCH_SQL = """
+    SELECT id, date AS "Date", time AS "Time", what_i_did AS "What I Did", user_id,
+           COUNT(*) OVER () AS total
+    FROM (
+        SELECT *, coalesce(ts_rank(search_tsv, to_tsquery('simple', %(tsquery)s)), 0)
+                  + CASE WHEN what_i_did ILIKE %(pattern)s THEN 0.5 ELSE 0 END AS rank
+        FROM time_log
+        WHERE user_id = %(user_id)s
+          AND (search_tsv @@ to_tsquery('simple', %(tsquery)s)
+               OR what_i_did ILIKE %(pattern)s OR time ILIKE %(pattern)s)
+    ) matches
+    ORDER BY rank DESC, date DESC, time DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+
+def tokenize(text):
+    return re.findall(r"\w+", str(text).lower())
+
+
+def _grams(text):
+    # Trigrams of ``text``; shorter texts are their own single gram, so every
+    # substring of a text is contained in one of its grams
+    if len(text) < 3:
+        return {text} if text else set()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _like_pattern(query):
+    escaped = query.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def ensure_search_schema(conn):
+    # Migration only; ``conn`` must be in autocommit mode (see SEARCH_SCHEMA)
+    with conn.cursor() as cur:
+        for stmt in SEARCH_SCHEMA:
+            cur.execute(stmt)
+
+
+def search_schema_ready(conn):
+    # True once the migration has added search_tsv to time_log
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'time_log' AND column_name = 'search_tsv'")
+        return cur.fetchone() is not None
+
+
+def search_time_log(conn, user_id, query, limit=None, offset=0):
+    # (total matches, frame of the requested page) from Postgres; punctuation-only
+    # queries such as "-" have no words and match by substring alone
+    if not query.strip():
+        return 0, pd.DataFrame(columns=RESULT_COLUMNS)
+    tokens = tokenize(query)
+    params = {
+        "user_id": user_id,
+        "tsquery": " & ".join(f"{t}:*" for t in tokens) if tokens else None,
+        "pattern": _like_pattern(query),
+        "limit": limit,  # NULL means no limit
+        "offset": offset,
+    }
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(_SEARCH_SQL, params)
+        rows = cur.fetchall()
+    if not rows:
+        return 0, pd.DataFrame(columns=RESULT_COLUMNS)
+    df = pd.DataFrame(rows)
+    total = int(df["total"].iloc[0])
+    df = df.drop(columns=["total"])
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    return total, df
+
+
+class InvertedIndex:
+    # Token -> sorted row positions over one user's frame (What I Did + Time),
+    # plus trigram -> row positions per column for substring matches
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        postings = {}
+        # Lower-cased columns for substring (ILIKE) matches
+        self.activity_text = self.df["What I Did"].fillna("").astype(str).str.lower().tolist()
+        self.time_text = self.df["Time"].fillna("").astype(str).str.lower().tolist()
+        text = self.df["What I Did"].fillna("").astype(str) + " " + self.df["Time"].fillna("").astype(str)
+        for pos, value in enumerate(text):
+            for token in set(tokenize(value)):
+                postings.setdefault(token, []).append(pos)
+        self.vocab = sorted(postings)
+        self.postings = {t: np.array(p, dtype=np.int64) for t, p in postings.items()}
+        self.activity_grams = self._gram_postings(self.activity_text)
+        self.time_grams = self._gram_postings(self.time_text)
+        # Position of each row when sorted most recent first, breaks ties between equally ranked rows
+        dates = pd.to_datetime(self.df["Date"], errors="coerce")
+        recency = (
+            pd.DataFrame({"d": dates, "t": self.df["Time"].astype(str)})
+            .sort_values(["d", "t"], ascending=False, na_position="last")
+            .index.to_numpy()
+        )
+        self.recency_rank = np.empty(len(recency), dtype=np.int64)
+        self.recency_rank[recency] = np.arange(len(recency))
+
+    @staticmethod
+    def _gram_postings(texts):
+        postings = {}
+        for pos, value in enumerate(texts):
+            for gram in _grams(value):
+                postings.setdefault(gram, []).append(pos)
+        return {g: np.array(p, dtype=np.int64) for g, p in postings.items()}
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df)
+
+    def _prefix_matches(self, prefix):
+        # Positions of rows containing a token that starts with ``prefix`` (+ exact hits)
+        lo = bisect_left(self.vocab, prefix)
+        hi = bisect_left(self.vocab, prefix + "\U0010ffff")
+        tokens = self.vocab[lo:hi]
+        if not tokens:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        rows = np.unique(np.concatenate([self.postings[t] for t in tokens]))
+        exact = self.postings.get(prefix, np.array([], dtype=np.int64))
+        return rows, exact
+
+    def _substring_matches(self, needle, grams, texts):
+        # Positions of rows whose text contains ``needle``. Needles of 3+ chars
+        # intersect the postings of their trigrams (rarest first) and check the
+        # few candidates left; shorter ones union the grams that contain them,
+        # which costs the number of distinct grams, not rows.
+        if len(needle) >= 3:
+            lists = [grams.get(needle[i:i + 3]) for i in range(len(needle) - 2)]
+            if any(rows is None for rows in lists):
+                return np.array([], dtype=np.int64)
+            lists.sort(key=len)
+            candidates = lists[0]
+            for rows in lists[1:]:
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+                if not len(candidates):
+                    break
+            if len(needle) == 3:
+                return candidates
+            return np.array([pos for pos in candidates if needle in texts[pos]], dtype=np.int64)
+        lists = [rows for gram, rows in grams.items() if needle in gram]
+        return np.unique(np.concatenate(lists)) if lists else np.array([], dtype=np.int64)
+
+    def search(self, query, limit=None, offset=0):
+        # (total matches, frame of the requested page); like search_time_log, an
+        # entry matches if every query word prefix-matches one of its words or
+        # the whole query is a substring of What I Did or Time. Exact word
+        # matches and What I Did substrings rank higher.
+        needle = query.strip().lower()
+        if not needle:
+            return 0, self.df.iloc[0:0]
+        tokens = tokenize(query)
+        word_matches = []
+        matched = None
+        for token in tokens:
+            rows, exact = self._prefix_matches(token)
+            word_matches.append((rows, exact))
+            matched = rows if matched is None else np.intersect1d(matched, rows, assume_unique=True)
+        in_activity = self._substring_matches(needle, self.activity_grams, self.activity_text)
+        in_time = self._substring_matches(needle, self.time_grams, self.time_text)
+        parts = [in_activity, in_time] + ([matched] if matched is not None else [])
+        matched = np.unique(np.concatenate(parts))
+        if not len(matched):
+            return 0, self.df.iloc[0:0]
+        # Scores only for the matched rows
+        score = np.zeros(len(matched))
+        for rows, exact in word_matches:
+            score += np.isin(matched, rows)
+            score += np.isin(matched, exact)
+        score += 0.5 * np.isin(matched, in_activity)
+        # Rank by score, newest first within the same score
+        order = matched[np.lexsort((self.recency_rank[matched], -score))]
+        end = None if limit is None else offset + limit
+        return len(order), self.df.iloc[order[offset:end]]
+
+
+if __name__ == "__main__":
+    import logging
+    import os
+    import sys
+    import psycopg2
+    database_url = os.getenv("DATABASE_URL") or (sys.argv[1] if len(sys.argv) > 1 else None)
+    if not database_url:
+        sys.exit("usage: DATABASE_URL=postgresql://... python search_index.py [DATABASE_URL]")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    try:
+        ensure_search_schema(conn)
+        logging.info("Search schema ready")
+    finally:
+        conn.close()
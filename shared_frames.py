@@ -0,0 +1,186 @@
+# ------------------------
+# 🗂 Shared memory-mapped time log frames for multi-worker deployments
+# ------------------------
+# Each user's time log frame is published once to a local file and every
+# Streamlit process on the host maps that file instead of holding its own
+# cached copy.  Text columns are dictionary-encoded (int32 codes + one list of
+# distinct values), dates are stored as datetime64 and numbers as-is, all as
+# fixed-width arrays that np.memmap reads straight from the page cache, which
+# the kernel shares between processes.  A file carries the data version it was
+# built from; writers publish to a temporary file and os.replace() it into
+# place, so readers see either the old or the new frame, never a partial one.
+#
+# File layout: MAGIC, uint64 header length, JSON header, then each column's
+# array at a 64-byte aligned offset.
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+SHARED_DIR = os.getenv("SHARED_FRAMES_DIR", "shared_frames")
+MAX_AGE = 60.0  # seconds; also picks up changes made outside the app (same as the old loader ttl)
+MAGIC = b"DTFRAME1"
+ALIGN = 64
+
+
+def _align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _encode(df):
+    # [(column spec, array)] for every column of ``df``
+    columns = []
+    for name in df.columns:
+        col = df[name]
+        if pd.api.types.is_datetime64_any_dtype(col) and getattr(col.dt, "tz", None) is None:
+            values = col.to_numpy(dtype="datetime64[ns]").view(np.int64)
+            columns.append(({"name": name, "kind": "datetime", "dtype": "<i8"}, values))
+        elif isinstance(col.dtype, np.dtype) and col.dtype.kind in "iuf":
+            values = col.to_numpy()
+            columns.append(({"name": name, "kind": "numeric", "dtype": values.dtype.str}, values))
+        else:
+            codes, uniques = pd.factorize(col)
+            dictionary = [_json_value(v) for v in uniques]
+            columns.append(({"name": name, "kind": "dictionary", "dtype": "<i4", "dictionary": dictionary}, codes.astype("<i4")))
+    return columns
+
+
+def _decode(spec, values):
+    if spec["kind"] == "datetime":
+        return np.asarray(values).view("datetime64[ns]")
+    if spec["kind"] == "numeric":
+        return values
+    # Code -1 (missing) picks the trailing None
+    dictionary = np.array(spec["dictionary"] + [None], dtype=object)
+    return dictionary[np.asarray(values)]
+
+
+def _version(data_version):
+    # As stored in (and read back from) the JSON header: tuples become lists
+    return json.loads(json.dumps(data_version))
+
+
+def _file_name(key):
+    # Readable and filesystem-safe, with a hash so distinct keys never collide
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", str(key))[:40]
+    return f"{safe}-{hashlib.sha1(str(key).encode()).hexdigest()[:12]}.frame"
+
+
+class SharedFrames:
+    def __init__(self, directory=SHARED_DIR, max_age=MAX_AGE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        # key -> (file identity, header, mapped arrays); remapped when the file is replaced
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return self.directory / _file_name(key)
+
+    # ------------------------
+    # Writers
+    # ------------------------
+    def publish(self, key, data_version, df):
+        columns = _encode(df)
+        specs, offset = [], 0
+        for spec, values in columns:
+            specs.append(dict(spec, offset=offset))
+            offset = _align(offset + values.nbytes)
+        header = json.dumps({
+            "key": str(key),
+            "data_version": _version(data_version),
+            "published_at": time.time(),
+            "rows": len(df),
+            "columns": specs,
+        }).encode()
+        data_start = _align(len(MAGIC) + 8 + len(header))
+        target = self.path(key)
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+            for spec, (_, values) in zip(specs, columns):
+                f.seek(data_start + spec["offset"])
+                f.write(np.ascontiguousarray(values).tobytes())
+            f.truncate(data_start + offset)
+        # Readers see the old file or the new one, never a partial write
+        os.replace(tmp, target)
+
+    # ------------------------
+    # Readers
+    # ------------------------
+    def _map(self, key):
+        path = self.path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        # Header and arrays come from the same open file, even if it is replaced meanwhile
+        with f:
+            stat = os.fstat(f.fileno())
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            with self._lock:
+                cached = self._maps.get(key)
+                if cached is not None and cached[0] == identity:
+                    return cached[1], cached[2]
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length))
+            data_start = _align(len(MAGIC) + 8 + length)
+            arrays = {}
+            for spec in header["columns"]:
+                if header["rows"] == 0:
+                    arrays[spec["name"]] = np.empty(0, dtype=spec["dtype"])
+                else:
+                    arrays[spec["name"]] = np.memmap(f, dtype=spec["dtype"], mode="r", offset=data_start + spec["offset"], shape=(header["rows"],))
+        with self._lock:
+            self._maps[key] = (identity, header, arrays)
+        return header, arrays
+
+    def load(self, key, data_version):
+        # The published frame for ``key`` if it was built from ``data_version``
+        # and is fresh enough, else None (caller loads and publishes)
+        mapped = self._map(key)
+        if mapped is None:
+            self.misses += 1
+            return None
+        header, arrays = mapped
+        if header["data_version"] != _version(data_version) or time.time() - header["published_at"] > self.max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pd.DataFrame({spec["name"]: _decode(spec, arrays[spec["name"]]) for spec in header["columns"]})
+
+    def age(self, key, data_version):
+        # Seconds since ``key`` was published for ``data_version``, None if it wasn't
+        mapped = self._map(key)
+        if mapped is None or mapped[0]["data_version"] != _version(data_version):
+            return None
+        return time.time() - mapped[0]["published_at"]
+
+    def status(self):
+        files = list(self.directory.glob("*.frame"))
+        return {
+            "files": len(files),
+            "bytes": sum(f.stat().st_size for f in files),
+            "mapped": len(self._maps),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
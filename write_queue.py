@@ -0,0 +1,297 @@
+# ------------------------
+# 📥 Durable write-behind queue for new time log entries
+# ------------------------
+# "Add Entry" appends to a local SQLite file (WAL mode) and returns immediately.
+# A background flusher thread batch-inserts queued rows into Postgres and only
+# deletes them from the queue once the insert has committed.  Every row carries
+# an idempotency key, so a batch that is retried after a lost commit
+# acknowledgement is never inserted twice.  While Postgres is unreachable rows
+# simply stay queued, so an outage loses no data.  Queued rows can still be
+# edited or deleted: the change is made in the queue (a delete leaves a
+# tombstone) and bumps the row's revision, and the flusher only forgets a row
+# whose revision it actually sent, so a change that lands mid-flush is sent
+# again instead of being lost.
+#
+# The idempotency column and its unique index on time_log are created by a
+# migration, not by the flusher (the index is built concurrently, which
+# doesn't fit in the app's statement timeout or its transactions):
+#   DATABASE_URL=postgresql://... python write_queue.py
+# Until it has run, flushes fail with a pointer to it and entries stay queued.
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from psycopg2.extras import execute_values
+
+QUEUE_FILE = "write_queue.db"
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0  # seconds between flushes when idle
+MAX_BACKOFF = 60.0  # seconds
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_time_log (
+    idempotency_key TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    what_i_did TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    queued_at TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0,
+    deleted INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# Columns added after the first release, for queue files created before them
+_UPGRADES = {
+    "revision": "ALTER TABLE pending_time_log ADD COLUMN revision INTEGER NOT NULL DEFAULT 0",
+    "deleted": "ALTER TABLE pending_time_log ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0",
+}
+
+# Lets Postgres reject replays of a batch that already committed. CONCURRENTLY
+# needs autocommit; an interrupted build leaves an INVALID index that IF NOT
+# EXISTS then skips, so drop it before re-running
+_PG_SCHEMA = [
+    "ALTER TABLE time_log ADD COLUMN IF NOT EXISTS idempotency_key TEXT",
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS time_log_idempotency_key_idx ON time_log (idempotency_key)",
+]
+
+# ON CONFLICT (idempotency_key) needs the unique index, and a valid one
+_PG_READY_SQL = """
+    SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = 'time_log_idempotency_key_idx'
+"""
+
+# A replayed row that was edited in the queue meanwhile updates the copy already in Postgres
+_INSERT_SQL = """
+    INSERT INTO time_log (date, time, what_i_did, user_id, idempotency_key) VALUES %s
+    ON CONFLICT (idempotency_key) DO UPDATE
+    SET date = EXCLUDED.date, time = EXCLUDED.time, what_i_did = EXCLUDED.what_i_did
+    WHERE (time_log.date, time_log.time, time_log.what_i_did)
+          IS DISTINCT FROM (EXCLUDED.date, EXCLUDED.time, EXCLUDED.what_i_did)
+"""
+
+# Rows deleted while queued; the earlier revision may already have been flushed
+_DELETE_SQL = "DELETE FROM time_log WHERE idempotency_key = ANY(%s)"
+
+
+def ensure_pg_schema(conn):
+    # Migration only; ``conn`` must be in autocommit mode (see _PG_SCHEMA)
+    with conn.cursor() as cur:
+        for stmt in _PG_SCHEMA:
+            cur.execute(stmt)
+
+
+def pg_schema_ready(conn):
+    with conn.cursor() as cur:
+        cur.execute(_PG_READY_SQL)
+        row = cur.fetchone()
+    return bool(row and row[0])
+
+
+class WriteQueue:
+    def __init__(self, connect, path=QUEUE_FILE, on_flush=None):
+        # ``connect`` returns a new psycopg2 connection (or raises);
+        # ``on_flush(user_ids)`` runs after rows for those users reach Postgres
+        self.connect = connect
+        self.path = path
+        self.on_flush = on_flush
+        self.backoff = 0.0
+        self.last_error = None
+        self._conn = None
+        self._schema_ready = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        with self._sqlite() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(pending_time_log)")}
+            for column, stmt in _UPGRADES.items():
+                if column not in columns:
+                    try:
+                        db.execute(stmt)
+                    except sqlite3.OperationalError:
+                        pass  # another process added it first
+
+    @contextmanager
+    def _sqlite(self):
+        # One short-lived connection per call; commits on success and always closes
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # ------------------------
+    # Producer side (Streamlit request threads)
+    # ------------------------
+    def enqueue(self, date, time_range, what_i_did, user_id):
+        key = uuid.uuid4().hex
+        with self._sqlite() as db:
+            db.execute(
+                "INSERT INTO pending_time_log (idempotency_key, date, time, what_i_did, user_id, queued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, str(date), time_range, what_i_did, user_id, datetime.now().isoformat())
+            )
+        self._wake.set()
+        return key
+
+    def update(self, key, date, time_range, what_i_did):
+        # Edits a queued row; False if it is no longer queued (already flushed, then edit it in Postgres)
+        with self._sqlite() as db:
+            changed = db.execute(
+                """UPDATE pending_time_log SET date = ?, time = ?, what_i_did = ?, revision = revision + 1
+                   WHERE idempotency_key = ? AND NOT deleted""",
+                (str(date), time_range, what_i_did, key)
+            ).rowcount
+        self._wake.set()
+        return changed > 0
+
+    def remove(self, key):
+        # Deletes a queued row; False if it is no longer queued (already flushed, then delete it in Postgres)
+        with self._sqlite() as db:
+            changed = db.execute(
+                "UPDATE pending_time_log SET deleted = 1, revision = revision + 1 WHERE idempotency_key = ? AND NOT deleted",
+                (key,)
+            ).rowcount
+        self._wake.set()
+        return changed > 0
+
+    def depth(self, user_id=None):
+        with self._sqlite() as db:
+            if user_id is None:
+                return db.execute("SELECT COUNT(*) FROM pending_time_log WHERE NOT deleted").fetchone()[0]
+            return db.execute("SELECT COUNT(*) FROM pending_time_log WHERE user_id = ? AND NOT deleted", (user_id,)).fetchone()[0]
+
+    def pending(self, user_id=None):
+        # Queued rows as dicts (idempotency_key, date, time, what_i_did, user_id), oldest first
+        with self._sqlite() as db:
+            db.row_factory = sqlite3.Row
+            if user_id is None:
+                rows = db.execute("SELECT idempotency_key, date, time, what_i_did, user_id FROM pending_time_log WHERE NOT deleted ORDER BY rowid").fetchall()
+            else:
+                rows = db.execute("SELECT idempotency_key, date, time, what_i_did, user_id FROM pending_time_log WHERE user_id = ? AND NOT deleted ORDER BY rowid", (user_id,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def discard(self, user_id):
+        # Deletes all of a user's queued rows (their account was removed); returns how many.
+        # Like remove(), this leaves tombstones, so a batch of theirs that is being
+        # flushed right now and commits after the purge is deleted again by the next flush
+        with self._sqlite() as db:
+            changed = db.execute(
+                "UPDATE pending_time_log SET deleted = 1, revision = revision + 1 WHERE user_id = ? AND NOT deleted",
+                (user_id,)
+            ).rowcount
+        self._wake.set()
+        return changed
+
+    def status(self):
+        return {
+            "depth": self.depth(),
+            "backoff_seconds": self.backoff,
+            "last_error": self.last_error,
+            "running": bool(self._thread and self._thread.is_alive()),
+        }
+
+    # ------------------------
+    # Consumer side (flusher thread)
+    # ------------------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="write-queue-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                flushed = self.flush()
+                self.backoff = 0.0
+                self.last_error = None
+                if flushed == BATCH_SIZE:
+                    continue  # more rows waiting, keep draining
+                wait = FLUSH_INTERVAL
+            except Exception as e:
+                self.last_error = str(e)
+                self.backoff = min(MAX_BACKOFF, max(1.0, self.backoff * 2))
+                wait = self.backoff
+                logging.warning(f"Write queue flush failed, retrying in {wait:.0f}s: {e}")
+                self._reset_conn()
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _pg(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self.connect()
+            self._schema_ready = False
+        if not self._schema_ready:
+            with self._conn as conn:
+                ready = pg_schema_ready(conn)
+            if not ready:
+                raise RuntimeError("time_log has no valid idempotency_key index yet; run 'python write_queue.py'")
+            self._schema_ready = True
+        return self._conn
+
+    def _reset_conn(self):
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def flush(self):
+        # Move one batch to Postgres; returns the number of rows flushed
+        with self._sqlite() as db:
+            rows = db.execute(
+                "SELECT idempotency_key, date, time, what_i_did, user_id, revision, deleted FROM pending_time_log ORDER BY rowid LIMIT ?",
+                (BATCH_SIZE,)
+            ).fetchall()
+        if not rows:
+            return 0
+        started = time.perf_counter()
+        live = [(r[1], r[2], r[3], r[4], r[0]) for r in rows if not r[6]]
+        deleted = [r[0] for r in rows if r[6]]
+        with self._pg() as conn:
+            with conn.cursor() as cur:
+                if live:
+                    execute_values(cur, _INSERT_SQL, live, page_size=BATCH_SIZE)
+                if deleted:
+                    cur.execute(_DELETE_SQL, (deleted,))
+        # Only forget rows once Postgres has committed them, and only the revision that was sent
+        with self._sqlite() as db:
+            db.executemany("DELETE FROM pending_time_log WHERE idempotency_key = ? AND revision = ?", [(r[0], r[5]) for r in rows])
+        logging.info(f"Flushed {len(rows)} queued entries to database in {time.perf_counter() - started:.3f}s")
+        if self.on_flush:
+            try:
+                self.on_flush(sorted({r[4] for r in rows}))
+            except Exception as e:
+                logging.error(f"Write queue on_flush callback failed: {e}")
+        return len(rows)
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import psycopg2
+    database_url = os.getenv("DATABASE_URL") or (sys.argv[1] if len(sys.argv) > 1 else None)
+    if not database_url:
+        sys.exit("usage: DATABASE_URL=postgresql://... python write_queue.py [DATABASE_URL]")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    try:
+        ensure_pg_schema(conn)
+        logging.info("Write queue schema ready")
+    finally:
+        conn.close()